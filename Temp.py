@@ -1,40 +1,81 @@
-                            crew = Crew(agents=[oracle_analyst, dbt_modeler, snowflake_optimizer, quality_reviewer], tasks=[task1, task2, task3, task4], verbose=True)
+                            # The checkpoint is read once and kept in session state; it is re-read only
+                            # when the file changed underneath (e.g. another session appended to it).
+                            checkpoint = st.session_state.setdefault("migration_ckpt", {"mtime": None, "entries": {}})
+                            checkpoint_mtime = os.path.getmtime("migration_ckpt.jsonl") if os.path.exists("migration_ckpt.jsonl") else None
+                            if checkpoint["mtime"] != checkpoint_mtime:
+                                checkpoint["entries"] = {}
+                                if checkpoint_mtime is not None:
+                                    with open("migration_ckpt.jsonl", "r") as f:
+                                        checkpoint["entries"] = {(entry["name"], entry["sha256"]): entry for entry in map(json.loads, f)}
+                                checkpoint["mtime"] = checkpoint_mtime
+
+                            checkpoint_sha256 = hashlib.sha256(f"{model_type}\n{file_content}".encode("utf-8")).hexdigest()
+                            checkpoint_key = (file.name, checkpoint_sha256)
+                            previous = checkpoint["entries"].get(checkpoint_key)
+                            if checkpoint_key in st.session_state.get("ckpt_rerun", set()):
+                                previous = None
+
+                            if previous and os.path.exists(previous.get("path", "")):
+                                summary_path = previous["path"]
+                                st.info(f"⏭️ `{file.name}` was already migrated in a previous run; showing its saved summary.")
+                                # Runs as a callback, so it takes effect on the next Convert click.
+                                st.button(
+                                    f"🔁 Re-run `{file.name}` anyway",
+                                    key=f"rerun_{file.name}_{checkpoint_sha256[:12]}",
+                                    on_click=lambda key=checkpoint_key: st.session_state.setdefault("ckpt_rerun", set()).add(key),
+                                )
+                                status.update(label="⏭️ **Reused a previous migration.**", state="complete", expanded=False)
+                            else:
+                                crew = Crew(agents=[oracle_analyst, dbt_modeler, snowflake_optimizer, quality_reviewer], tasks=[task1, task2, task3, task4], verbose=True, task_callback=lambda output: status.write(f"**{output.agent}**\n\n{output.raw}"))
+                            
+                                cache_key = hashlib.sha256("\n".join([model_type, *(task.description for task in crew.tasks)]).encode("utf-8")).hexdigest()
+                                cache_path = os.path.join(".llm_cache", f"{cache_key}.txt")
                             
-                            try:
-                                llm_result = crew.kickoff()
-                                logging.info("CrewAI execution completed.")
+                                try:
+                                    if os.path.exists(cache_path):
+                                        with open(cache_path, "r") as f:
+                                            llm_result = f.read()
+                                        status.write("♻️ Reusing cached CrewAI output for identical input.")
+                                    else:
+                                        llm_result = str(crew.kickoff())
+                                        os.makedirs(".llm_cache", exist_ok=True)
+                                        with open(cache_path, "w") as f:
+                                            f.write(llm_result)
+                                    logging.info("CrewAI execution completed.")
                                 
-                                final_output_str = llm_result.get('final_task_output', '') if isinstance(llm_result, dict) else str(llm_result)
-                                logging.debug(f"Raw AI Output: {final_output_str}")
+                                    final_output_str = llm_result.get('final_task_output', '') if isinstance(llm_result, dict) else str(llm_result)
+                                    logging.debug(f"Raw AI Output: {final_output_str}")
 
-                                if hasattr(crew, 'tasks_outputs') and crew.tasks_outputs:
-                                    oracle_logic_summary = crew.tasks_outputs[0]
-                                else:
-                                    oracle_logic_summary = "No summary available."
+                                    if hasattr(crew, 'tasks_outputs') and crew.tasks_outputs:
+                                        oracle_logic_summary = crew.tasks_outputs[0]
+                                    else:
+                                        oracle_logic_summary = "No summary available."
 
-                                clean_sql = ""
-                                if "```sql" in final_output_str:
-                                    clean_sql = re.search(r"```sql\s*(.*?)\s*```", final_output_str, re.DOTALL).group(1)
-                                elif "```" in final_output_str:
-                                    clean_sql = re.search(r"```\s*(.*?)\s*```", final_output_str, re.DOTALL).group(1)
-                                else:
-                                    clean_sql = final_output_str.strip()
+                                    sql_match = re.search(r"```(?:sql)?\s*(.*?)\s*```", final_output_str, re.DOTALL | re.IGNORECASE)
+                                    clean_sql = sql_match.group(1) if sql_match else final_output_str.strip()
                                 
-                                clean_sql = clean_sql.encode('utf-8').decode('unicode_escape')
-                                logging.info("Decoded literal escape sequences.")
-                                logging.debug(f"Cleaned and decoded SQL:\n{clean_sql}")
+                                    if "\\" in clean_sql:
+                                        clean_sql = codecs.decode(clean_sql, 'unicode_escape')
+                                        logging.info("Decoded literal escape sequences.")
+                                    logging.debug(f"Cleaned and decoded SQL:\n{clean_sql}")
 
-                                converted_sql = convert_oracle_to_snowflake(clean_sql)
-                                wrapped_sql = wrap_sql_in_dbt_model(converted_sql, model_type)
+                                    converted_sql = convert_oracle_to_snowflake(clean_sql)
+                                    wrapped_sql = wrap_sql_in_dbt_model(converted_sql, model_type)
 
-                                summary_path = create_summary_file(log_dir, file.name, wrapped_sql, model_type, oracle_logic_summary)
+                                    summary_path = create_summary_file(log_dir, file.name, wrapped_sql, model_type, oracle_logic_summary)
+                                    checkpoint_entry = {"name": file.name, "sha256": checkpoint_sha256, "path": summary_path}
+                                    with open("migration_ckpt.jsonl", "a") as f:
+                                        f.write(json.dumps(checkpoint_entry) + "\n")
+                                    checkpoint["entries"][checkpoint_key] = checkpoint_entry
+                                    checkpoint["mtime"] = os.path.getmtime("migration_ckpt.jsonl")
+                                    st.session_state.get("ckpt_rerun", set()).discard(checkpoint_key)
                                 
-                                status.update(label="✅ **Migration complete!**", state="complete", expanded=False)
-                            except Exception as e:
-                                logging.critical(f"CrewAI execution failed with an exception: {e}")
-                                status.update(label="❌ **Migration failed.**", state="error", expanded=False)
-                                st.error(f"❌ CrewAI execution failed: {e}")
-                                continue
+                                    status.update(label="✅ **Migration complete!**", state="complete", expanded=False)
+                                except Exception as e:
+                                    logging.critical(f"CrewAI execution failed with an exception: {e}")
+                                    status.update(label="❌ **Migration failed.**", state="error", expanded=False)
+                                    st.error(f"❌ CrewAI execution failed: {e}")
+                                    continue
                     
                     # Moved outside of the 'with st.status' block
                     if summary_path:
@@ -3,71 +3,133 @@
                             st.error("❌ Snowflake Cortex LLM is not initialized. Cannot process this file type.")
                             continue
 
-                        with st.status(f"Using CrewAI to convert `{file.name}`...", expanded=True) as status:
-                            oracle_analyst = Agent(role="Oracle PL/SQL Analyst", goal="Analyze and explain the logic of Oracle procedures, functions, packages, and views.", backstory="A seasoned expert in Oracle PL/SQL, meticulously breaking down complex business logic, procedural constructs (BEGIN/END blocks, FOR loops, IF/ELSE statements), and database interactions.", llm=custom_llm, verbose=True)
-                            dbt_modeler = Agent(role="Snowflake DBT Modeler", goal="Translate Oracle procedural and declarative logic into clean, efficient, and modular Snowflake dbt models.", backstory="A master of Snowflake SQL and DBT best practices. This agent focuses on converting imperative procedural logic into a single, declarative SQL query that can be run as a dbt model. It understands how to replace procedural constructs with efficient SQL statements.", llm=custom_llm, verbose=True)
-                            snowflake_optimizer = Agent(role="Snowflake Optimizer", goal="Refactor and optimize the converted SQL for Snowflake's architecture, ensuring maximum performance.", backstory="A performance engineer with deep knowledge of Snowflake's query engine, ensuring all code runs at peak efficiency. This agent applies best practices like `QUALIFY`, `ROW_NUMBER`, and proper join techniques.", llm=custom_llm, verbose=True)
-                            quality_reviewer = Agent(role="SQL Quality Reviewer", goal="Validate the final DBT model for correctness, formatting, and adherence to standards.", backstory="A meticulous reviewer who ensures the final output is production-ready, well-formatted, and follows coding standards.", llm=custom_llm, verbose=True)
+                        # The checkpoint is read once and kept in session state; it is re-read only
+                        # when the file changed underneath (e.g. another session appended to it).
+                        checkpoint = st.session_state.setdefault("migration_ckpt", {"mtime": None, "entries": {}})
+                        checkpoint_mtime = os.path.getmtime("migration_ckpt.jsonl") if os.path.exists("migration_ckpt.jsonl") else None
+                        if checkpoint["mtime"] != checkpoint_mtime:
+                            checkpoint["entries"] = {}
+                            if checkpoint_mtime is not None:
+                                with open("migration_ckpt.jsonl", "r") as f:
+                                    checkpoint["entries"] = {(entry["name"], entry["sha256"]): entry for entry in map(json.loads, f)}
+                            checkpoint["mtime"] = checkpoint_mtime
+
+                        checkpoint_sha256 = hashlib.sha256(f"{model_type}\n{file_content}".encode("utf-8")).hexdigest()
+                        checkpoint_key = (file.name, checkpoint_sha256)
+                        previous = checkpoint["entries"].get(checkpoint_key)
+                        if checkpoint_key in st.session_state.get("ckpt_rerun", set()):
+                            previous = None
+
+                        # The model is kept in the entry itself: the saved model file can be
+                        # overwritten by a later upload with the same name but different content.
+                        if previous and "wrapped_sql" in previous:
+                            st.info(f"⏭️ `{file.name}` was already migrated in a previous run; reusing its stored model.")
+                            # Runs as a callback, so it takes effect on the next Convert click.
+                            st.button(
+                                f"🔁 Re-run `{file.name}` anyway",
+                                key=f"rerun_{file.name}_{checkpoint_sha256[:12]}",
+                                on_click=lambda key=checkpoint_key: st.session_state.setdefault("ckpt_rerun", set()).add(key),
+                            )
+                            wrapped_sql = previous["wrapped_sql"]
+                        else:
+                            # Drop comments and redundant whitespace (string literals are kept as-is)
+                            # so the Oracle source costs fewer prompt tokens.
+                            compressed_content = re.sub(
+                                r"(?P<literal>'(?:[^']|'')*')|(?P<comment>--[^\n]*|/\*.*?\*/)|(?P<newline>\s*\n\s*)|(?P<space>[ \t]+)",
+                                lambda m: {"literal": m.group(0), "comment": "", "newline": "\n", "space": " "}[m.lastgroup],
+                                file_content,
+                                flags=re.DOTALL,
+                            ).strip()
+
+                            with st.status(f"Using CrewAI to convert `{file.name}`...", expanded=True) as status:
+                                oracle_analyst = Agent(role="Oracle PL/SQL Analyst", goal="Analyze and explain the logic of Oracle procedures, functions, packages, and views.", backstory="A seasoned expert in Oracle PL/SQL, meticulously breaking down complex business logic, procedural constructs (BEGIN/END blocks, FOR loops, IF/ELSE statements), and database interactions.", llm=custom_llm, verbose=True)
+                                dbt_modeler = Agent(role="Snowflake DBT Modeler", goal="Translate Oracle procedural and declarative logic into clean, efficient, and modular Snowflake dbt models.", backstory="A master of Snowflake SQL and DBT best practices. This agent focuses on converting imperative procedural logic into a single, declarative SQL query that can be run as a dbt model. It understands how to replace procedural constructs with efficient SQL statements.", llm=custom_llm, verbose=True)
+                                snowflake_optimizer = Agent(role="Snowflake Optimizer", goal="Refactor and optimize the converted SQL for Snowflake's architecture, ensuring maximum performance.", backstory="A performance engineer with deep knowledge of Snowflake's query engine, ensuring all code runs at peak efficiency. This agent applies best practices like `QUALIFY`, `ROW_NUMBER`, and proper join techniques.", llm=custom_llm, verbose=True)
                             
-                            status.write("🕵️ Analyzing Oracle logic...")
-                            task1 = Task(description=f"""
-                                Analyze the following Oracle {source_type} code and document its core business logic.
-                                The documentation must clearly explain:
-                                1. The purpose and a high-level overview of the code.
-                                2. Any variables, cursors, or loops used.
-                                3. The main data flow, including source tables, filters, joins, and the final output or action.
-                                4. How to convert procedural elements like BEGIN/END blocks, FOR loops, and IF/ELSE statements into a single, declarative SELECT statement.
-                                Oracle {source_type} code:\n\n{file_content}
-                            """, expected_output=f"A clear, structured document explaining the {source_type.lower()}'s logic and a plan for converting it to a declarative SQL query.", agent=oracle_analyst)
+                                status.write("🕵️ Analyzing Oracle logic...")
+                                task1 = Task(description=f"""
+                                    Analyze the following Oracle {source_type} code and document its core business logic.
+                                    The documentation must clearly explain:
+                                    1. The purpose and a high-level overview of the code.
+                                    2. Any variables, cursors, or loops used.
+                                    3. The main data flow, including source tables, filters, joins, and the final output or action.
+                                    4. How to convert procedural elements like BEGIN/END blocks, FOR loops, and IF/ELSE statements into a single, declarative SELECT statement.
+                                    Oracle {source_type} code:\n\n{compressed_content}
+                                """, expected_output=f"A clear, structured document explaining the {source_type.lower()}'s logic and a plan for converting it to a declarative SQL query.", agent=oracle_analyst)
 
-                            status.write("🤖 Translating to Snowflake SQL...")
-                            task2 = Task(description=f"""
-                                Based on the analysis from the Oracle PL/SQL Analyst, convert the procedural logic into a single DBT model SQL file for Snowflake.
-                                The output must be a single, executable SQL SELECT statement that can be materialized as a {model_type}.
-                                All procedural constructs (loops, conditional logic, etc.) must be replaced with equivalent declarative SQL (e.g., using CTEs, CASE statements, and set-based logic).
-                                Do NOT include any DDL statements (CREATE, ALTER, DROP, etc.) or procedural blocks (BEGIN, END). The output should be pure SQL.
-                            """, expected_output="A single, well-formatted DBT model SQL file (a SELECT statement) that can be run on Snowflake.", agent=dbt_modeler)
+                                status.write("🤖 Translating to Snowflake SQL...")
+                                task2 = Task(description=f"""
+                                    Based on the analysis from the Oracle PL/SQL Analyst, convert the procedural logic into a single DBT model SQL file for Snowflake.
+                                    The output must be a single, executable SQL SELECT statement that can be materialized as a {model_type}.
+                                    All procedural constructs (loops, conditional logic, etc.) must be replaced with equivalent declarative SQL (e.g., using CTEs, CASE statements, and set-based logic).
+                                    Do NOT include any DDL statements (CREATE, ALTER, DROP, etc.) or procedural blocks (BEGIN, END). The output should be pure SQL.
+                                """, expected_output="A single, well-formatted DBT model SQL file (a SELECT statement) that can be run on Snowflake.", agent=dbt_modeler)
 
-                            status.write("⚙️ Optimizing query for Snowflake...")
-                            task3 = Task(description="""
-                                Given the converted DBT model SQL, review and apply optimizations for Snowflake's architecture.
-                                - Optimize joins and WHERE clauses.
-                                - Use Snowflake-specific functions where they improve performance.
-                                - Ensure the query is efficient for Snowflake's columnar storage and micro-partitioning.
-                                The output must be the complete, optimized SQL query.
-                            """, expected_output="An optimized DBT model SQL file with Snowflake-specific enhancements.", agent=snowflake_optimizer)
+                                status.write("⚙️ Optimizing and reviewing query for Snowflake...")
+                                task3 = Task(description="""
+                                    Given the converted DBT model SQL, apply optimizations for Snowflake's architecture and review the result in the same pass.
+                                    - Optimize joins and WHERE clauses.
+                                    - Use Snowflake-specific functions where they improve performance.
+                                    - Ensure the query is efficient for Snowflake's columnar storage and micro-partitioning.
+                                    - Correctness: Does the SQL logic match the original business logic?
+                                    - Formatting: Is the code well-indented and easy to read?
+                                    - Style: Does it follow best practices for dbt and Snowflake?
+                                    The output must be the final, production-ready SQL query.
+                                """, expected_output="The final, optimized, production-ready DBT model SQL, formatted with correct indentation and comments.", agent=snowflake_optimizer)
                             
-                            status.write("✅ Final review and validation complete.")
-                            task4 = Task(description="""
-                                Review the final, optimized DBT model SQL.
-                                Check for:
-                                - Correctness: Does the SQL logic match the original business logic?
-                                - Formatting: Is the code well-indented and easy to read?
-                                - Style: Does it follow best practices for dbt and Snowflake?
-                                - Final Output: The output should be the final, production-ready SQL.
-                            """, expected_output="The final, production-ready DBT model SQL, formatted with correct indentation and comments.", agent=quality_reviewer)
+                                crew = Crew(agents=[oracle_analyst, dbt_modeler, snowflake_optimizer], tasks=[task1, task2, task3], verbose=True, task_callback=lambda output: status.write(f"**{output.agent}**\n\n{output.raw}"))
                             
-                            crew = Crew(agents=[oracle_analyst, dbt_modeler, snowflake_optimizer, quality_reviewer], tasks=[task1, task2, task3, task4], verbose=True)
+                                cache_key = hashlib.sha256("\n".join([model_type, *(task.description for task in crew.tasks)]).encode("utf-8")).hexdigest()
+                                cache_path = os.path.join(".llm_cache", f"{cache_key}.txt")
                             
-                            try:
-                                llm_result = crew.kickoff()
+                                try:
+                                    if os.path.exists(cache_path):
+                                        with open(cache_path, "r") as f:
+                                            llm_result = f.read()
+                                        status.write("♻️ Reusing cached CrewAI output for identical input.")
+                                    else:
+                                        llm_result = str(crew.kickoff())
+                                        # Quality gate for the merged optimize/review step: if no query came
+                                        # back or procedural blocks leaked through, escalate to a dedicated review.
+                                        # Only the fenced SQL is checked, so prose around it cannot decide the gate.
+                                        gate_match = re.search(r"```(?:sql)?\s*(.*?)\s*```", llm_result, re.DOTALL | re.IGNORECASE)
+                                        gate_sql = gate_match.group(1) if gate_match else llm_result
+                                        if not re.search(r"\bSELECT\b", gate_sql, re.IGNORECASE) or re.search(r"\b(?:BEGIN|DECLARE)\b", gate_sql, re.IGNORECASE):
+                                            status.write("🔁 Output failed the SQL check, running a separate quality review...")
+                                            quality_reviewer = Agent(role="SQL Quality Reviewer", goal="Validate the final DBT model for correctness, formatting, and adherence to standards.", backstory="A meticulous reviewer who ensures the final output is production-ready, well-formatted, and follows coding standards.", llm=custom_llm, verbose=True)
+                                            task4 = Task(description=f"""
+                                                Review the following DBT model SQL produced from the Oracle code analyzed earlier.
+                                                Check for:
+                                                - Correctness: Does the SQL logic match the original business logic?
+                                                - Formatting: Is the code well-indented and easy to read?
+                                                - Style: Does it follow best practices for dbt and Snowflake?
+                                                - Final Output: The output should be the final, production-ready SQL, with no procedural blocks (BEGIN, END, DECLARE).
+                                                DBT model SQL:\n\n{llm_result}
+                                            """, expected_output="The final, production-ready DBT model SQL, formatted with correct indentation and comments.", agent=quality_reviewer)
+                                            llm_result = str(Crew(agents=[quality_reviewer], tasks=[task4], verbose=True).kickoff())
+                                        os.makedirs(".llm_cache", exist_ok=True)
+                                        with open(cache_path, "w") as f:
+                                            f.write(llm_result)
                                 
-                                # --- START OF NEW FIX ---
-                                # Use regex to extract only the SQL code block from the AI's response
-                                sql_match = re.search(r'```sql\n(.*?)```', llm_result, re.DOTALL)
-                                if sql_match:
-                                    clean_sql = sql_match.group(1).strip()
-                                else:
+                                    # --- START OF NEW FIX ---
+                                    # Use regex to extract only the SQL code block from the AI's response
                                     # If no markdown block is found, assume the entire result is the SQL
-                                    clean_sql = str(llm_result).strip()
+                                    sql_match = re.search(r"```(?:sql)?\s*(.*?)\s*```", llm_result, re.DOTALL | re.IGNORECASE)
+                                    clean_sql = sql_match.group(1) if sql_match else llm_result.strip()
                                     
-                                # Final check for remaining Oracle syntax
-                                converted_sql = convert_oracle_to_snowflake(clean_sql)
-                                wrapped_sql = wrap_sql_in_dbt_model(converted_sql, model_type)
-                                # --- END OF NEW FIX ---
+                                    # Final check for remaining Oracle syntax
+                                    converted_sql = convert_oracle_to_snowflake(clean_sql)
+                                    wrapped_sql = wrap_sql_in_dbt_model(converted_sql, model_type)
+                                    # --- END OF NEW FIX ---
                                 
-                                status.update(label="Migration complete!", state="complete", expanded=False)
-                            except Exception as e:
-                                status.update(label="Migration failed.", state="error", expanded=False)
-                                st.error(f"❌ CrewAI execution failed: {e}")
-                                continue
+                                    checkpoint_entry = {"name": file.name, "sha256": checkpoint_sha256, "wrapped_sql": wrapped_sql}
+                                    with open("migration_ckpt.jsonl", "a") as f:
+                                        f.write(json.dumps(checkpoint_entry) + "\n")
+                                    checkpoint["entries"][checkpoint_key] = checkpoint_entry
+                                    checkpoint["mtime"] = os.path.getmtime("migration_ckpt.jsonl")
+                                    st.session_state.get("ckpt_rerun", set()).discard(checkpoint_key)
+                                    status.update(label="Migration complete!", state="complete", expanded=False)
+                                except Exception as e:
+                                    status.update(label="Migration failed.", state="error", expanded=False)
+                                    st.error(f"❌ CrewAI execution failed: {e}")
+                                    continue
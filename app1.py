@@ -1,9 +1,15 @@
 import streamlit as st
 import sqlparse
+import sqlglot
 import subprocess
+import threading
+import time
 import re
 import os
 import uuid
+import functools
+from collections import deque
+from sql_conversion import CAST_CALL_REWRITES, convert as convert_oracle_sql
 
 # --- SQL Validation ---
 def validate_sql(sql_text):
@@ -16,54 +22,108 @@ def validate_sql(sql_text):
         return False, str(e)
 
 # --- Oracle to Snowflake SQL Conversion ---
+# Rules live in sql_conversion.py; this app keeps its original four cast-style rewrites.
+_CALL_REWRITES = {name: CAST_CALL_REWRITES[name] for name in ("NVL", "DECODE", "TO_DATE", "TO_CHAR")}
+
 def convert_oracle_to_snowflake(sql_text):
-    sql_text = re.sub(r'\bSYSDATE\b', 'CURRENT_TIMESTAMP', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bNVL\s*\(([^,]+),\s*([^)]+)\)', r'COALESCE(\1, \2)', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bDECODE\s*\(\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^)]+)\)', r'CASE WHEN \1 = \2 THEN \3 ELSE \4 END', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bTO_DATE\s*\(\s*([^)]+)\)', r'\1::DATE', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bTO_CHAR\s*\(\s*([^)]+)\)', r'\1::TEXT', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\(\+\)', '', sql_text)
-    sql_text = re.sub(r'\bROWNUM\s*<=\s*(\d+)', r'LIMIT \1', sql_text, flags=re.IGNORECASE)
-    return sql_text
+    return convert_oracle_sql(sql_text, _CALL_REWRITES)
+
+@functools.lru_cache(maxsize=512)
+def convert_with_sqlglot(sql_text):
+    try:
+        statements = sqlglot.transpile(sql_text, read="oracle", write="snowflake", pretty=True)
+        if not statements:
+            return None, "Empty or invalid SQL."
+        return ";\n\n".join(statements), None
+    except sqlglot.errors.SqlglotError as e:
+        return None, str(e)
 
 # --- Wrap SQL in DBT Model ---
-def wrap_sql_in_dbt_model(sql_text, model_type, unique_key="id"):
-    if model_type == "view":
-        return f"{{{{ config(materialized='view') }}}}\n\n{sql_text}"
-    elif model_type == "table":
-        return f"{{{{ config(materialized='table') }}}}\n\n{sql_text}"
-    elif model_type == "incremental":
-        return f"""{{{{ config(materialized='incremental', unique_key='{unique_key}', tags=['oracle_migration']) }}}}
-{sql_text}
+_DBT_CONFIG_HEADERS = {
+    "view": "{{ config(materialized='view') }}\n\n",
+    "table": "{{ config(materialized='table') }}\n\n",
+}
+
+_INCREMENTAL_FOOTER = """
 
-{{% if is_incremental() %}}
+{% if is_incremental() %}
 -- Add incremental filter logic here
-{{% endif %}}"""
+{% endif %}"""
+
+def wrap_sql_in_dbt_model(sql_text, model_type, unique_key="id"):
+    if model_type in _DBT_CONFIG_HEADERS:
+        return _DBT_CONFIG_HEADERS[model_type] + sql_text
+    elif model_type == "incremental":
+        header = f"{{{{ config(materialized='incremental', unique_key='{unique_key}', tags=['oracle_migration']) }}}}\n"
+        return header + sql_text + _INCREMENTAL_FOOTER
     else:
         return sql_text
 
 # --- Run DBT Command ---
-def run_dbt_command(command):
+DBT_OUTPUT_MAX_LINES = 500
+DBT_OUTPUT_REFRESH_SECONDS = 0.5
+
+def run_dbt_command(command_list):
+    # Yields stdout lines while dbt is still running and returns (returncode, stderr) once it exits.
+    # stderr is drained on its own thread so neither pipe can fill up and stall dbt.
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        return result.stdout, result.stderr
+        with subprocess.Popen(command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1) as process:
+            stderr_tail = deque(maxlen=DBT_OUTPUT_MAX_LINES)
+            drain = threading.Thread(target=stderr_tail.extend, args=(process.stderr,), daemon=True)
+            drain.start()
+            yield from process.stdout
+            drain.join()
+            return process.wait(), "".join(stderr_tail)
     except Exception as e:
-        return "", str(e)
+        return None, str(e)
+
+def show_dbt_output(command_list):
+    # Keeps only the latest lines and redraws at most every DBT_OUTPUT_REFRESH_SECONDS.
+    output = st.empty()
+    lines = deque(maxlen=DBT_OUTPUT_MAX_LINES)
+    stream = run_dbt_command(command_list)
+    last_refresh = 0.0
+    while True:
+        try:
+            lines.append(next(stream))
+        except StopIteration as finished:
+            returncode, stderr = finished.value
+            break
+        if time.monotonic() - last_refresh >= DBT_OUTPUT_REFRESH_SECONDS:
+            output.code("".join(lines), language="bash")
+            last_refresh = time.monotonic()
+    output.code("".join(lines), language="bash")
+    if stderr:
+        st.text_area("DBT Errors", stderr, height=200)
+    if returncode == 0:
+        st.success("✅ dbt finished successfully.")
+    elif returncode is None:
+        st.error("❌ dbt could not be started.")
+    else:
+        st.error(f"❌ dbt exited with status {returncode}.")
+    return returncode
 
 # --- Page Navigation Setup ---
 pages = ["Home", "Environment Setup", "Migration Settings"]
 
 if "page_index" not in st.session_state:
     st.session_state.page_index = 0
+st.session_state.setdefault("sidebar_radio", pages[st.session_state.page_index])
+
+def _sync_page_from_sidebar():
+    st.session_state.page_index = pages.index(st.session_state.sidebar_radio)
+
+def _step_page(offset):
+    # Runs as a button callback, before the script reruns, so the new page
+    # renders on this click without a second st.rerun().
+    new_index = st.session_state.page_index + offset
+    if 0 <= new_index < len(pages):
+        st.session_state.page_index = new_index
+        st.session_state.sidebar_radio = pages[new_index]
 
 # Sidebar navigation
 st.sidebar.title("Oracle ➜ Snowflake DBT Migration")
-selected_page = st.sidebar.radio("", pages, index=st.session_state.page_index, key="sidebar_radio")
-
-# Sync page_index with sidebar selection
-if pages.index(selected_page) != st.session_state.page_index:
-    st.session_state.page_index = pages.index(selected_page)
-    st.rerun()
+st.sidebar.radio("", pages, key="sidebar_radio", on_change=_sync_page_from_sidebar)
 
 # --- Page Content ---
 current_page = pages[st.session_state.page_index]
@@ -94,6 +154,7 @@ elif current_page == "Environment Setup":
     st.code("pip install dbt-core==1.9.4 dbt-snowflake==1.9.4")
     st.subheader("For running the utility install below packages:")
     st.code("pip install sqlparse")
+    st.code("pip install sqlglot")
     st.code("pip install pandas")
 
 elif current_page == "Migration Settings":
@@ -110,13 +171,16 @@ elif current_page == "Migration Settings":
         if uploaded_files:
             for file in uploaded_files:
                 try:
-                    sql_content = file.read().decode("utf-8")
-                    is_valid, message = validate_sql(sql_content)
-                    if not is_valid:
-                        st.error(f"Validation failed for `{file.name}`: {message}")
-                        continue
-
-                    converted_sql = convert_oracle_to_snowflake(sql_content)
+                    sql_content = str(file.getbuffer(), "utf-8")
+                    # A successful sqlglot parse already validates the SQL, so
+                    # sqlparse only runs for input that needs the regex fallback.
+                    converted_sql, error = convert_with_sqlglot(sql_content)
+                    if error:
+                        is_valid, message = validate_sql(sql_content)
+                        if not is_valid:
+                            st.error(f"Validation failed for `{file.name}`: {message}")
+                            continue
+                        converted_sql = convert_oracle_to_snowflake(sql_content)
                     wrapped_sql = wrap_sql_in_dbt_model(converted_sql, model_type, unique_key)
 
                     # Sanitize filename
@@ -147,12 +211,9 @@ elif current_page == "Migration Settings":
     if st.button("Execute DBT"):
         st.session_state["dbt_path"] = dbt_path
         if dbt_path:
-            cmd = f"dbt {dbt_command} --project-dir {dbt_path}"
-            st.markdown(f"### Running: `{cmd}`")
-            stdout, stderr = run_dbt_command(cmd)
-            st.text_area("DBT Output", stdout, height=200)
-            if stderr:
-                st.text_area("DBT Errors", stderr, height=200)
+            cmd_list = ["dbt", *dbt_command.split(), "--project-dir", dbt_path]
+            st.markdown(f"### Running: `{' '.join(cmd_list)}`")
+            show_dbt_output(cmd_list)
         else:
             st.warning("Please provide DBT project path.")
 
@@ -160,10 +221,6 @@ elif current_page == "Migration Settings":
 st.markdown("<br><hr>", unsafe_allow_html=True)
 col1, col2 = st.columns([6, 1])
 with col1:
-    if st.button("⬅️ Previous") and st.session_state.page_index > 0:
-        st.session_state.page_index -= 1
-        st.rerun()
+    st.button("⬅️ Previous", on_click=_step_page, args=(-1,))
 with col2:
-    if st.button("Next ➡️") and st.session_state.page_index < len(pages) - 1:
-        st.session_state.page_index += 1
-        st.rerun()
\ No newline at end of file
+    st.button("Next ➡️", on_click=_step_page, args=(1,))
\ No newline at end of file
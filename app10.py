@@ -1,34 +1,56 @@
 import streamlit as st
 import sqlparse
 import subprocess
+import threading
+import time
 import snowflake.connector
 import json
 import os
+import hashlib
+import contextlib
+from collections import deque
 
 # --- Profile Persistence Helpers ---
 PROFILES_FILE = "profiles.json"
 
+@st.cache_data(show_spinner=False)
+def _load_saved_profiles(mtime_ns):
+    # mtime_ns is only the cache key: edits to the file invalidate the entry.
+    with open(PROFILES_FILE, "r") as f:
+        return json.load(f)
+
 def load_profiles():
     profiles = {"Default (from secrets.toml)": st.secrets.get("snowflake", {})}
-    if os.path.exists(PROFILES_FILE):
-        with open(PROFILES_FILE, "r") as f:
-            profiles.update(json.load(f))
+    try:
+        mtime_ns = os.stat(PROFILES_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return profiles
+    profiles.update(_load_saved_profiles(mtime_ns))
     return profiles
 
+def _write_profiles(profiles):
+    # Write to a temp file and swap it in, so a crash mid-write never leaves
+    # a truncated profiles.json behind.
+    tmp_path = PROFILES_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(json.dumps(profiles, separators=(",", ":")))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, PROFILES_FILE)
+    _load_saved_profiles.clear()
+
 def save_profile(profile_name, creds):
     profiles = load_profiles()
     profiles[profile_name] = creds
     profiles.pop("Default (from secrets.toml)", None)
-    with open(PROFILES_FILE, "w") as f:
-        json.dump(profiles, f, indent=2)
+    _write_profiles(profiles)
 
 def delete_profile(profile_name):
     profiles = load_profiles()
     if profile_name in profiles:
         del profiles[profile_name]
         profiles.pop("Default (from secrets.toml)", None)
-        with open(PROFILES_FILE, "w") as f:
-            json.dump(profiles, f, indent=2)
+        _write_profiles(profiles)
 
 # --- SQL Validation ---
 def validate_sql(sql_text):
@@ -41,43 +63,107 @@ def validate_sql(sql_text):
         return False, str(e)
 
 # --- Snowflake Connection Test ---
+@st.cache_resource(show_spinner=False)
+def get_snowflake_connection(user, account, warehouse, database, schema, password_hash, _password):
+    # The raw password is left out of the cache key; its hash keeps a changed
+    # password from reusing a connection opened with the old one.
+    return snowflake.connector.connect(
+        user=user,
+        password=_password,
+        account=account,
+        warehouse=warehouse,
+        database=database,
+        schema=schema
+    )
+
+def _probe_connection(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1").fetchone()
+
 def test_snowflake_connection(user, password, account, warehouse, database, schema):
     try:
-        conn = snowflake.connector.connect(
-            user=user,
-            password=password,
-            account=account,
-            warehouse=warehouse,
-            database=database,
-            schema=schema
-        )
-        conn.cursor().execute("SELECT CURRENT_VERSION()")
+        password_hash = hashlib.sha256(password.encode("utf-8")).hexdigest()
+        conn_args = (user, account, warehouse, database, schema, password_hash, password)
+        conn = get_snowflake_connection(*conn_args)
+        try:
+            # A cached session can expire server-side, so a round-trip decides whether it is still usable.
+            _probe_connection(conn)
+        except Exception:
+            # Only this connection's entry is dropped; other cached connections stay open.
+            get_snowflake_connection.clear(*conn_args)
+            with contextlib.suppress(Exception):
+                conn.close()
+            conn = get_snowflake_connection(*conn_args)
+            _probe_connection(conn)
         return True, "Connection successful!"
     except Exception as e:
         return False, str(e)
 
 # --- Run DBT Command ---
-def run_dbt_command(command):
+DBT_OUTPUT_MAX_LINES = 500
+DBT_OUTPUT_REFRESH_SECONDS = 0.5
+
+def run_dbt_command(command_list):
+    # Yields stdout lines while dbt is still running and returns (returncode, stderr) once it exits.
+    # stderr is drained on its own thread so neither pipe can fill up and stall dbt.
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        return result.stdout, result.stderr
+        with subprocess.Popen(command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1) as process:
+            stderr_tail = deque(maxlen=DBT_OUTPUT_MAX_LINES)
+            drain = threading.Thread(target=stderr_tail.extend, args=(process.stderr,), daemon=True)
+            drain.start()
+            yield from process.stdout
+            drain.join()
+            return process.wait(), "".join(stderr_tail)
     except Exception as e:
-        return "", str(e)
+        return None, str(e)
+
+def show_dbt_output(command_list):
+    # Keeps only the latest lines and redraws at most every DBT_OUTPUT_REFRESH_SECONDS.
+    output = st.empty()
+    lines = deque(maxlen=DBT_OUTPUT_MAX_LINES)
+    stream = run_dbt_command(command_list)
+    last_refresh = 0.0
+    while True:
+        try:
+            lines.append(next(stream))
+        except StopIteration as finished:
+            returncode, stderr = finished.value
+            break
+        if time.monotonic() - last_refresh >= DBT_OUTPUT_REFRESH_SECONDS:
+            output.code("".join(lines), language="bash")
+            last_refresh = time.monotonic()
+    output.code("".join(lines), language="bash")
+    if stderr:
+        st.text_area("DBT Errors", stderr, height=200)
+    if returncode == 0:
+        st.success("✅ dbt finished successfully.")
+    elif returncode is None:
+        st.error("❌ dbt could not be started.")
+    else:
+        st.error(f"❌ dbt exited with status {returncode}.")
+    return returncode
 
 # --- Page Navigation Setup ---
 pages = ["Home", "Environment Setup", "Migration Settings", "SQL Validation"]
 
 if "page_index" not in st.session_state:
     st.session_state.page_index = 0
+st.session_state.setdefault("sidebar_radio", pages[st.session_state.page_index])
+
+def _sync_page_from_sidebar():
+    st.session_state.page_index = pages.index(st.session_state.sidebar_radio)
+
+def _step_page(offset):
+    # Runs as a button callback, before the script reruns, so the new page
+    # renders on this click without a second st.rerun().
+    new_index = st.session_state.page_index + offset
+    if 0 <= new_index < len(pages):
+        st.session_state.page_index = new_index
+        st.session_state.sidebar_radio = pages[new_index]
 
 # Sidebar navigation (stable)
 st.sidebar.title("Oracle ➜ Snowflake DBT Migration")
-selected_page = st.sidebar.radio(
-    "", pages, index=st.session_state.page_index, key="sidebar_radio"
-)
-if pages.index(selected_page) != st.session_state.page_index:
-    st.session_state.page_index = pages.index(selected_page)
-    st.rerun()
+st.sidebar.radio("", pages, key="sidebar_radio", on_change=_sync_page_from_sidebar)
 
 # --- Page Content ---
 st.markdown("## Oracle to Snowflake DBT Migration")
@@ -184,24 +270,18 @@ if st.button("Execute DBT"):
     if dbt_path:
         if run_full_workflow:
             commands = [
-                f"dbt seed --project-dir {dbt_path}",
-                f"dbt run --project-dir {dbt_path}",
-                f"dbt test --project-dir {dbt_path}",
-                f"dbt docs generate --project-dir {dbt_path}"
+                ["dbt", "seed", "--project-dir", dbt_path],
+                ["dbt", "run", "--project-dir", dbt_path],
+                ["dbt", "test", "--project-dir", dbt_path],
+                ["dbt", "docs", "generate", "--project-dir", dbt_path]
             ]
-            for cmd in commands:
-                st.markdown(f"### Running: `{cmd}`")
-                stdout, stderr = run_dbt_command(cmd)
-                st.text_area(f"Output for `{cmd}`", stdout, height=200)
-                if stderr:
-                    st.text_area(f"Errors for `{cmd}`", stderr, height=200)
+            for cmd_list in commands:
+                st.markdown(f"### Running: `{' '.join(cmd_list)}`")
+                show_dbt_output(cmd_list)
         else:
-            cmd = f"dbt {dbt_command} --project-dir {dbt_path}"
-            st.markdown(f"### Running: `{cmd}`")
-            stdout, stderr = run_dbt_command(cmd)
-            st.text_area("DBT Output", stdout, height=200)
-            if stderr:
-                st.text_area("DBT Errors", stderr, height=200)
+            cmd_list = ["dbt", *dbt_command.split(), "--project-dir", dbt_path]
+            st.markdown(f"### Running: `{' '.join(cmd_list)}`")
+            show_dbt_output(cmd_list)
     else:
         st.warning("Please provide DBT project path.")
 
@@ -212,7 +292,7 @@ elif current_page == "Migration Settings":
     if st.button("Convert to DBT Models"):
         if uploaded_files:
             for file in uploaded_files:
-                sql_content = file.read().decode("utf-8")
+                sql_content = str(file.getbuffer(), "utf-8")
                 st.markdown(f"### Converted SQL for `{file.name}`")
                 st.code(f"-- Converted to {model_type}\n{sql_content}", language="sql")
             st.success("Conversion completed!")
@@ -232,10 +312,6 @@ elif current_page == "SQL Validation":
 st.markdown("<br><hr>", unsafe_allow_html=True)
 col1, col2 = st.columns([6, 1])
 with col1:
-    if st.button("⬅️ Previous") and st.session_state.page_index > 0:
-        st.session_state.page_index -= 1
-        st.rerun()
+    st.button("⬅️ Previous", on_click=_step_page, args=(-1,))
 with col2:
-    if st.button("Next ➡️") and st.session_state.page_index < len(pages) - 1:
-        st.session_state.page_index += 1
-        st.rerun()
\ No newline at end of file
+    st.button("Next ➡️", on_click=_step_page, args=(1,))
\ No newline at end of file
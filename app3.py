@@ -1,99 +1,172 @@
 import streamlit as st
-import sqlparse
-import subprocess
-import snowflake.connector
+import hashlib
+import asyncio
+import functools
+import shutil
+import types
+import codecs
+import contextlib
+import io
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # --- SQL Validation ---
-def validate_sql(sql_text):
+@st.cache_data(ttl=600, max_entries=256, show_spinner=False)
+def _parse_sql_cached(sql_text: str) -> tuple[bool, str]:
+    import sqlglot
     try:
-        parsed = sqlparse.parse(sql_text)
-        if not parsed or len(parsed) == 0:
+        parsed = [statement for statement in sqlglot.parse(sql_text, read="oracle") if statement is not None]
+        if not parsed:
             return False, "Empty or invalid SQL."
         return True, "SQL syntax looks valid."
-    except Exception as e:
+    except sqlglot.errors.SqlglotError as e:
         return False, str(e)
 
+def validate_sql(sql_text):
+    if not sql_text or sql_text.isspace():
+        return False, "Empty or invalid SQL."
+    return _parse_sql_cached(sql_text)
+
 # --- Snowflake Connection Test ---
-def test_snowflake_connection(user, password, account, warehouse, database, schema):
+@st.cache_resource(ttl=3600, show_spinner=False)
+def get_snowflake_conn(user, account, warehouse, database, schema, password_hash, _password):
+    # The leading underscore keeps the raw password out of the cache key.
+    import snowflake.connector
+    return snowflake.connector.connect(
+        user=user,
+        password=_password,
+        account=account,
+        warehouse=warehouse,
+        database=database,
+        schema=schema,
+        client_session_keep_alive=True,
+        client_prefetch_threads=4,
+        network_timeout=30,
+        login_timeout=15
+    )
+
+def test_snowflake_connection(user, password, account, warehouse, database, schema, deep_check=False):
+    password_hash = hashlib.sha256(password.encode("utf-8")).hexdigest()
+    conn_args = (user, account, warehouse, database, schema, password_hash, password)
+    conn = None
     try:
-        conn = snowflake.connector.connect(
-            user=user,
-            password=password,
-            account=account,
-            warehouse=warehouse,
-            database=database,
-            schema=schema
-        )
-        conn.cursor().execute("SELECT CURRENT_VERSION()")
-        return True, "Connection successful!"
+        conn = get_snowflake_conn(*conn_args)
+        if conn.is_closed():
+            get_snowflake_conn.clear(*conn_args)
+            conn = get_snowflake_conn(*conn_args)
+        if deep_check:
+            conn.cursor().execute("SELECT 1")
+        return True, f"Connected as {conn.user}@{conn.account}"
     except Exception as e:
+        # Only this user's entry is dropped, and its connection closed; other sessions keep theirs.
+        if conn is not None:
+            get_snowflake_conn.clear(*conn_args)
+            with contextlib.suppress(Exception):
+                conn.close()
         return False, str(e)
 
 # --- Run DBT Command ---
-def run_dbt_command(command):
+@functools.lru_cache(maxsize=1)
+def _dbt_bin():
+    return shutil.which("dbt") or "dbt"
+
+async def run_dbt_command(cmd_list, output, refresh_every=20):
+    # Streams stdout into the placeholder while dbt runs; only the last
+    # 2000 lines are kept. stderr is drained concurrently so neither pipe
+    # can fill up and stall the process.
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        return result.stdout, result.stderr
+        process = await asyncio.create_subprocess_exec(
+            *cmd_list, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
     except Exception as e:
         return "", str(e)
+    stderr_task = asyncio.create_task(process.stderr.read())
+    lines = deque(maxlen=2000)
+    line_count = 0
+    async for line in process.stdout:
+        lines.append(line.decode("utf-8", errors="replace"))
+        line_count += 1
+        if line_count % refresh_every == 0:
+            output.code("".join(lines), language="bash")
+    stderr = await stderr_task
+    await process.wait()
+    stdout = "".join(lines)
+    output.code(stdout or "(no output)", language="bash")
+    return stdout, stderr.decode("utf-8", errors="replace")
 
-# --- Define Snowflake Profiles ---
-SNOWFLAKE_PROFILES = {
-    "Default (from secrets.toml)": st.secrets.get("snowflake", {}),
-    "Account 2": {
-        "user": "user2",
-        "password": "password2",
-        "account": "account2",
-        "warehouse": "warehouse2",
-        "database": "database2",
-        "schema": "schema2"
-    },
-    "Account 3": {
-        "user": "user3",
-        "password": "password3",
-        "account": "account3",
-        "warehouse": "warehouse3",
-        "database": "database3",
-        "schema": "schema3"
-    },
-    "Account 4": {
-        "user": "user4",
-        "password": "password4",
-        "account": "account4",
-        "warehouse": "warehouse4",
-        "database": "database4",
-        "schema": "schema4"
-    },
-    "Account 5": {
-        "user": "user5",
-        "password": "password5",
-        "account": "account5",
-        "warehouse": "warehouse5",
-        "database": "database5",
-        "schema": "schema5"
-    }
-}
-
-# --- Page Navigation Setup ---
-pages = ["Home", "Environment Setup", "Migration Settings", "SQL Validation"]
+# --- Uploaded File Reading ---
+def read_upload_text(file, chunk_size=65536):
+    # Decodes in fixed-size chunks; the incremental decoder keeps multi-byte
+    # characters that straddle a chunk boundary intact.
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = io.StringIO()
+    file.seek(0)
+    while chunk := file.read(chunk_size):
+        buf.write(decoder.decode(chunk))
+    buf.write(decoder.decode(b"", final=True))
+    return buf.getvalue()
 
-if "page_index" not in st.session_state:
-    st.session_state.page_index = 0
+# --- DBT Model Conversion ---
+@st.cache_data(max_entries=512, show_spinner=False)
+def convert_sql(digest: bytes, _file, model_type: str) -> str:
+    # Keyed on the upload's digest rather than a full bytes copy; the file is
+    # only read, in chunks, on a cache miss.
+    return f"-- Converted to {model_type}\n" + read_upload_text(_file)
 
-# Sidebar navigation
-st.sidebar.title("Oracle ➜ Snowflake DBT Migration")
-selected_page = st.sidebar.radio("", pages, index=st.session_state.page_index)
+# --- Define Snowflake Profiles ---
+@st.cache_resource
+def _secrets_snapshot():
+    return types.MappingProxyType(dict(st.secrets.get("snowflake", {})))
 
-# Sync sidebar selection with session state
-if selected_page != pages[st.session_state.page_index]:
-    st.session_state.page_index = pages.index(selected_page)
+@st.cache_resource
+def _load_profiles():
+    return {
+        "Default (from secrets.toml)": _secrets_snapshot(),
+        "Account 2": {
+            "user": "user2",
+            "password": "password2",
+            "account": "account2",
+            "warehouse": "warehouse2",
+            "database": "database2",
+            "schema": "schema2"
+        },
+        "Account 3": {
+            "user": "user3",
+            "password": "password3",
+            "account": "account3",
+            "warehouse": "warehouse3",
+            "database": "database3",
+            "schema": "schema3"
+        },
+        "Account 4": {
+            "user": "user4",
+            "password": "password4",
+            "account": "account4",
+            "warehouse": "warehouse4",
+            "database": "database4",
+            "schema": "schema4"
+        },
+        "Account 5": {
+            "user": "user5",
+            "password": "password5",
+            "account": "account5",
+            "warehouse": "warehouse5",
+            "database": "database5",
+            "schema": "schema5"
+        }
+    }
 
-# --- Page Content ---
-st.markdown("## Oracle to Snowflake DBT Migration")
+# The password is deliberately not kept in session state.
+CREDENTIAL_FIELDS = ("user", "account", "warehouse", "database", "schema")
 
-current_page = pages[st.session_state.page_index]
+def _apply_profile():
+    # Switching profiles overwrites whatever was typed into the fields.
+    creds = _load_profiles()[st.session_state.profile_select]
+    for k in CREDENTIAL_FIELDS:
+        st.session_state[k] = creds.get(k, "")
 
-if current_page == "Home":
+# --- Page Content ---
+def render_home():
     st.markdown("### 🏗️ Introduction")
     st.markdown("""
     A Python-powered Streamlit app that helps migrate Oracle SQL queries to Snowflake DBT models—complete with validation, conversion, and documentation.
@@ -108,29 +181,29 @@ if current_page == "Home":
     - 🚀 Run DBT Commands
     """)
 
-elif current_page == "Environment Setup":
+def render_environment_setup():
     st.subheader("Snowflake Credentials")
     # Profile selection
-    profile_names = list(SNOWFLAKE_PROFILES.keys())
-    selected_profile = st.selectbox("Select Snowflake Profile", profile_names, key="profile_select")
-    creds = SNOWFLAKE_PROFILES[selected_profile]
-
-    # Allow user to override fields if needed
-    user = st.text_input("User", value=creds.get("user", st.session_state.get("user", "")))
-    password = st.text_input("Password", type="password", value=creds.get("password", st.session_state.get("password", "")))
-    account = st.text_input("Account", value=creds.get("account", st.session_state.get("account", "")))
-    warehouse = st.text_input("Warehouse", value=creds.get("warehouse", st.session_state.get("warehouse", "")))
-    database = st.text_input("Database", value=creds.get("database", st.session_state.get("database", "")))
-    schema = st.text_input("Schema", value=creds.get("schema", st.session_state.get("schema", "")))
-
-    if st.button("Test Snowflake Connection"):
-        st.session_state["user"] = user
-        st.session_state["password"] = password
-        st.session_state["account"] = account
-        st.session_state["warehouse"] = warehouse
-        st.session_state["database"] = database
-        st.session_state["schema"] = schema
-        success, message = test_snowflake_connection(user, password, account, warehouse, database, schema)
+    profiles = _load_profiles()
+    profile_names = list(profiles.keys())
+    selected_profile = st.selectbox("Select Snowflake Profile", profile_names, key="profile_select", on_change=_apply_profile)
+    creds = profiles[selected_profile]
+    for k in CREDENTIAL_FIELDS:
+        st.session_state.setdefault(k, creds.get(k, ""))
+
+    # Allow user to override fields if needed; edits only rerun on submit
+    with st.form("creds_form"):
+        user = st.text_input("User", key="user")
+        password = st.text_input("Password", type="password", value=creds.get("password", ""))
+        account = st.text_input("Account", key="account")
+        warehouse = st.text_input("Warehouse", key="warehouse")
+        database = st.text_input("Database", key="database")
+        schema = st.text_input("Schema", key="schema")
+        deep_check = st.checkbox("Run a test query", help="Also executes SELECT 1 on the warehouse.")
+        submitted = st.form_submit_button("Test Snowflake Connection")
+
+    if submitted:
+        success, message = test_snowflake_connection(user, password, account, warehouse, database, schema, deep_check)
         if success:
             st.success(message)
         else:
@@ -141,28 +214,42 @@ elif current_page == "Environment Setup":
     if st.button("Run DBT"):
         st.session_state["dbt_path"] = dbt_path
         if dbt_path:
-            stdout, stderr = run_dbt_command(f"dbt run --project-dir {dbt_path}")
-            st.text_area("DBT Output", stdout)
+            with st.expander("DBT stdout", expanded=True):
+                stdout, stderr = asyncio.run(run_dbt_command([_dbt_bin(), "run", "--project-dir", dbt_path], st.empty()))
             if stderr:
-                st.text_area("DBT Errors", stderr)
+                with st.expander("DBT stderr", expanded=True):
+                    st.code(stderr, language="bash")
         else:
             st.warning("Please provide DBT project path.")
 
-elif current_page == "Migration Settings":
+def render_migration_settings():
     uploaded_files = st.file_uploader("Upload Oracle SQL Files", accept_multiple_files=True, type=["sql"])
     model_type = st.selectbox("Select DBT Model Type", ["view", "table", "incremental"])
 
     if st.button("Convert to DBT Models"):
         if uploaded_files:
-            for file in uploaded_files:
-                sql_content = file.read().decode("utf-8")
-                st.markdown(f"### Converted SQL for `{file.name}`")
-                st.code(f"-- Converted to {model_type}\n{sql_content}", language="sql")
+            # blake2b releases the GIL on large buffers, so uploads are hashed in parallel.
+            # The workers touch no Streamlit APIs; the cached conversion runs on this
+            # thread, which has the script-run context, and keeps upload order.
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                digests = list(executor.map(lambda f: hashlib.blake2b(f.getbuffer(), digest_size=16).digest(), uploaded_files))
+            seen = {}
+            rendered = []
+            for file, digest in zip(uploaded_files, digests):
+                if digest in seen:
+                    st.info(f"`{file.name}` is a duplicate of `{seen[digest]}`; skipped.")
+                    continue
+                seen[digest] = file.name
+                rendered.append((file.name, convert_sql(digest, file, model_type)))
+            with st.container():
+                for name, converted_sql in rendered:
+                    st.markdown(f"### Converted SQL for `{name}`")
+                    st.code(converted_sql, language="sql")
             st.success("Conversion completed!")
         else:
             st.warning("Please upload at least one SQL file.")
 
-elif current_page == "SQL Validation":
+def render_sql_validation():
     sql_input = st.text_area("Paste your Oracle SQL query here")
     if st.button("Validate SQL"):
         is_valid, message = validate_sql(sql_input)
@@ -171,12 +258,35 @@ elif current_page == "SQL Validation":
         else:
             st.error(f"Validation failed: {message}")
 
+PAGES = {
+    "Home": render_home,
+    "Environment Setup": render_environment_setup,
+    "Migration Settings": render_migration_settings,
+    "SQL Validation": render_sql_validation,
+}
+
+# --- Page Navigation Setup ---
+pages = list(PAGES)
+
+st.session_state.setdefault("page_name", pages[0])
+
+def _step_page(offset):
+    page_index = pages.index(st.session_state.page_name) + offset
+    if 0 <= page_index < len(pages):
+        st.session_state.page_name = pages[page_index]
+
+# Sidebar navigation
+st.sidebar.title("Oracle ➜ Snowflake DBT Migration")
+st.sidebar.radio("", pages, key="page_name")
+
+st.markdown("## Oracle to Snowflake DBT Migration")
+
+PAGES[st.session_state.page_name]()
+
 # --- Next and Previous Buttons at Bottom ---
 st.markdown("<br><hr>", unsafe_allow_html=True)
 col1, col2 = st.columns([6, 1])
 with col1:
-    if st.button("⬅️ Previous") and st.session_state.page_index > 0:
-        st.session_state.page_index -= 1
+    st.button("⬅️ Previous", on_click=_step_page, args=(-1,))
 with col2:
-    if st.button("Next ➡️") and st.session_state.page_index < len(pages) - 1:
-        st.session_state.page_index += 1
\ No newline at end of file
+    st.button("Next ➡️", on_click=_step_page, args=(1,))
@@ -1,9 +1,21 @@
 import streamlit as st
 import sqlparse
-import subprocess
 import re
+import string
+import codecs
+import hashlib
 import os
-import uuid
+import pathlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from sql_conversion import CAST_CALL_REWRITES, convert as convert_oracle_sql
+
+# Faster DFA engine for the plain patterns when google-re2 is installed
+try:
+    import re2 as _ENGINE
+except ImportError:
+    _ENGINE = re
 
 # --- SQL Validation ---
 def validate_sql(sql_text):
@@ -16,36 +28,119 @@ def validate_sql(sql_text):
         return False, str(e)
 
 # --- Strip DDL Statements ---
+_DDL_RE = _ENGINE.compile(r'(?i)CREATE\s+(OR\s+REPLACE\s+)?(VIEW|TABLE|PROCEDURE|FUNCTION)\s+[^\n]+\n?')
+_AS_RE = _ENGINE.compile(r'(?i)^AS\s*\n?')
+
 def strip_ddl(sql_text):
-    sql_text = re.sub(r'(?i)CREATE\s+(OR\s+REPLACE\s+)?(VIEW|TABLE|PROCEDURE|FUNCTION)\s+[^\n]+\n?', '', sql_text)
-    sql_text = re.sub(r'(?i)^AS\s*\n?', '', sql_text)
+    sql_text = _DDL_RE.sub('', sql_text)
+    sql_text = _AS_RE.sub('', sql_text)
     return sql_text.strip()
 
 # --- Oracle to Snowflake SQL Conversion ---
+# Rules live in sql_conversion.py; this app uses the cast-style table.
+# Cheap prescan so already-migrated files skip the rewrite entirely.
+_QUICK_CHECK = _ENGINE.compile(r'(?i)\b(SYSDATE|NVL|DECODE|TO_DATE|TO_CHAR|TO_NUMBER|SUBSTR|ROWNUM)\b|\(\+\)')
+
 def convert_oracle_to_snowflake(sql_text):
-    sql_text = re.sub(r'\bSYSDATE\b', 'CURRENT_TIMESTAMP', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bNVL\s*\(([^,]+),\s*([^)]+)\)', r'COALESCE(\1, \2)', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bDECODE\s*\(([^,]+),\s*([^,]+),\s*([^,]+),\s*([^)]+)\)', r'CASE WHEN \1 = \2 THEN \3 ELSE \4 END', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bTO_DATE\s*\(([^)]+)\)', r'\1::DATE', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bTO_CHAR\s*\(([^)]+)\)', r'\1::TEXT', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bTO_NUMBER\s*\(([^)]+)\)', r'CAST(\1 AS NUMBER)', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bSUBSTR\s*\(([^,]+),\s*([^,]+)(?:,\s*([^)]+))?\)', r'SUBSTRING(\1, \2, \3)', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\(\+\)', '', sql_text)
-    sql_text = re.sub(r'\bROWNUM\s*<=\s*(\d+)', r'LIMIT \1', sql_text, flags=re.IGNORECASE)
-    return sql_text
+    if not _QUICK_CHECK.search(sql_text):
+        return sql_text
+    return convert_oracle_sql(sql_text, CAST_CALL_REWRITES)
 
 # --- Wrap SQL in DBT Model ---
 def wrap_sql_in_dbt_model(sql_text, model_type):
     config = f"{{{{ config(materialized='{model_type}') }}}}"
     return f"{config}\n\n{sql_text}"
 
+# --- Cached Conversion Pipeline ---
+@st.cache_data(max_entries=256, show_spinner=False)
+def _convert_cached(digest, _sql_content, model_type):
+    # Keyed on the content digest; the SQL text itself is not hashed again.
+    sql_content = strip_ddl(_sql_content)
+    is_valid, message = validate_sql(sql_content)
+    if not is_valid:
+        return False, message, None
+    converted_sql = convert_oracle_to_snowflake(sql_content)
+    return True, message, wrap_sql_in_dbt_model(converted_sql, model_type)
+
+# --- Upload Patterns ---
+_CREATE_PROCFUNC_RE = _ENGINE.compile(r'(?i)\bCREATE\s+(PROCEDURE|FUNCTION)\b')
+class _SafeNameTable(dict):
+    def __missing__(self, codepoint):
+        return "_"
+
+_SAFE_NAME_TABLE = _SafeNameTable((ord(ch), ch) for ch in string.ascii_letters + string.digits + "_-")
+# "_m" + decimal counter; older uuid-hex suffixes are never "m"-prefixed, so they are not parsed as counters
+_SEQ_SUFFIX_RE = re.compile(r'_m(\d{6,})\.sql$')
+
+# --- Per-File Processing ---
+def read_sql_upload(file, chunk_size=65536):
+    # One chunked pass decodes, hashes and checks for procedures without copying
+    # the whole upload into a second bytes object first.
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    hasher = hashlib.blake2b(digest_size=16)
+    parts = []
+    has_procedure = False
+    file.seek(0)
+    for chunk in iter(lambda: file.read(chunk_size), b""):
+        hasher.update(chunk)
+        text = decoder.decode(chunk)
+        if not has_procedure:
+            # Re-scan a short overlap so a match split across two chunks is still seen.
+            overlap = parts[-1][-64:] if parts else ""
+            has_procedure = bool(_CREATE_PROCFUNC_RE.search(overlap + text))
+        parts.append(text)
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts), hasher.hexdigest(), has_procedure
+
+def next_model_seq(output_dir):
+    # Continues after the highest suffix already on disk, so a new session or a
+    # browser refresh never starts again at 1 in a shared models directory.
+    on_disk = (int(m.group(1)) for path in output_dir.glob("*.sql") if (m := _SEQ_SUFFIX_RE.search(path.name)))
+    return max(st.session_state.get("_seq", 0), max(on_disk, default=0))
+
+def write_new_model(output_dir, safe_name, wrapped_bytes):
+    # Exclusive create: if another session took the name first, move on to the next suffix.
+    while True:
+        st.session_state["_seq"] += 1
+        output_filename = output_dir / f"{safe_name}_m{st.session_state['_seq']:06d}.sql"
+        try:
+            with open(output_filename, "xb") as f:
+                f.write(wrapped_bytes)
+            return output_filename
+        except FileExistsError:
+            continue
+
+def process_file(file, upload, model_type, output_dir):
+    # Runs on the script thread: _convert_cached needs its script-run context.
+    sql_content, digest, has_procedure = upload
+    is_valid, message, wrapped_sql = _convert_cached(digest, sql_content, model_type)
+    if not is_valid:
+        return has_procedure, message, None, None, None
+    base_name = os.path.splitext(file.name)[0]
+    safe_name = base_name.translate(_SAFE_NAME_TABLE)
+    wrapped_bytes = wrapped_sql.encode("utf-8")
+    output_filename = write_new_model(output_dir, safe_name, wrapped_bytes)
+    return has_procedure, message, safe_name, output_filename, wrapped_bytes
+
 # --- Run DBT Command ---
-def run_dbt_command(command_list):
+# dbtRunner keeps global flags and adapter state, so in-process runs from different
+# sessions must not overlap; the lock is a cached resource so reruns share one instance.
+@st.cache_resource
+def _dbt_lock():
+    return threading.Lock()
+
+def run_dbt_command(args):
+    # Runs dbt in-process through its programmatic API instead of forking the CLI.
+    from dbt.cli.main import dbtRunner
+    log_lines = deque(maxlen=2000)
     try:
-        result = subprocess.run(command_list, capture_output=True, text=True)
-        return result.stdout, result.stderr
+        with _dbt_lock():
+            runner = dbtRunner(callbacks=[lambda event: log_lines.append(event.info.msg)])
+            result = runner.invoke(args)
     except Exception as e:
-        return "", str(e)
+        return "\n".join(log_lines), str(e)
+    stderr = "" if result.success else str(result.exception or "dbt reported failures; see the output above.")
+    return "\n".join(log_lines), stderr
 
 # --- Streamlit Tabs ---
 st.set_page_config(page_title="Oracle to Snowflake DBT Migration", layout="wide")
@@ -94,8 +189,7 @@ with tab3:
 
     output_dir = None
     if dbt_path:
-        output_dir = os.path.join(dbt_path, "models", subfolder)
-        os.makedirs(output_dir, exist_ok=True)
+        output_dir = pathlib.Path(dbt_path, "models", subfolder)
     else:
         st.warning("⚠️ Please provide a valid DBT project path to save models.")
 
@@ -106,31 +200,37 @@ with tab3:
 
     if st.button("🚀 Convert and Save Models"):
         if uploaded_files and output_dir:
-            with st.spinner("Converting SQL files..."):
-                for file in uploaded_files:
+            output_dir.mkdir(parents=True, exist_ok=True)
+            st.session_state["_seq"] = next_model_seq(output_dir)
+            results = []
+            progress = st.progress(0.0, text="Converting…")
+            # Workers only read, decode and hash the uploads; the cached conversion and all
+            # st.* calls stay on this thread, and results are handled in upload order.
+            with ThreadPoolExecutor(max_workers=min(8, len(uploaded_files))) as pool:
+                futures = [pool.submit(read_sql_upload, file) for file in uploaded_files]
+                for done, (file, future) in enumerate(zip(uploaded_files, futures), start=1):
+                    file_name = file.name
+                    progress.progress(done / len(futures), text=f"{done}/{len(futures)}: {file_name}")
                     try:
-                        sql_content = file.read().decode("utf-8")
-                        if re.search(r'\bCREATE\s+(PROCEDURE|FUNCTION)\b', sql_content, re.IGNORECASE):
-                            st.warning(f"⚠️ `{file.name}` contains a procedure/function which is not supported in DBT models.")
-                        sql_content = strip_ddl(sql_content)
-                        is_valid, message = validate_sql(sql_content)
-                        if not is_valid:
-                            st.error(f"Validation failed for `{file.name}`: {message}")
-                            continue
-                        converted_sql = convert_oracle_to_snowflake(sql_content)
-                        wrapped_sql = wrap_sql_in_dbt_model(converted_sql, model_type)
-                        base_name = os.path.splitext(file.name)[0]
-                        safe_name = re.sub(r'[^a-zA-Z0-9_\-]', '_', base_name)
-                        output_filename = os.path.join(output_dir, f"{safe_name}_{uuid.uuid4().hex[:8]}.sql")
-                        with open(output_filename, "w") as f:
-                            f.write(wrapped_sql)
-                        st.markdown(f"### ✅ Converted SQL for `{file.name}`")
-                        st.code(wrapped_sql, language="sql")
-                        with open(output_filename, "rb") as f:
-                            st.download_button(label=f"⬇️ Download `{safe_name}.sql`", data=f, file_name=f"{safe_name}.sql", mime="text/sql")
-                        st.success(f"✅ Saved to `{output_filename}`")
+                        has_procedure, message, safe_name, output_filename, wrapped_bytes = process_file(file, future.result(), model_type, output_dir)
                     except Exception as e:
-                        st.error(f"❌ Error processing `{file.name}`: {str(e)}")
+                        st.error(f"❌ Error processing `{file_name}`: {str(e)}")
+                        continue
+                    if has_procedure:
+                        st.warning(f"⚠️ `{file_name}` contains a procedure/function which is not supported in DBT models.")
+                    if wrapped_bytes is None:
+                        st.error(f"Validation failed for `{file_name}`: {message}")
+                        continue
+                    results.append((file_name, safe_name, output_filename, wrapped_bytes))
+
+            progress.empty()
+            # Rendered once conversion is done so conversion isn't interleaved with UI updates.
+            with st.container():
+                for file_name, safe_name, output_filename, wrapped_bytes in results:
+                    with st.expander(f"✅ Converted SQL for `{file_name}`"):
+                        st.code(wrapped_bytes.decode("utf-8"), language="sql")
+                        st.download_button(label=f"⬇️ Download `{safe_name}.sql`", data=wrapped_bytes, file_name=f"{safe_name}.sql", mime="text/sql")
+                        st.success(f"✅ Saved to `{output_filename}`")
         else:
             st.warning("⚠️ Please upload at least one SQL file and provide a valid DBT path.")
 
@@ -140,10 +240,10 @@ with tab3:
             if not os.path.exists(dbt_path):
                 st.error("❌ The specified DBT project path does not exist.")
             else:
-                cmd_list = ["dbt", dbt_command, "--project-dir", dbt_path]
-                st.markdown(f"### Running: `{' '.join(cmd_list)}`")
+                dbt_args = [dbt_command, "--project-dir", dbt_path]
+                st.markdown(f"### Running: `dbt {' '.join(dbt_args)}`")
                 with st.spinner("Executing DBT..."):
-                    stdout, stderr = run_dbt_command(cmd_list)
+                    stdout, stderr = run_dbt_command(dbt_args)
                 st.text_area("📄 DBT Output", stdout, height=200)
                 if stderr:
                     st.text_area("❌ DBT Errors", stderr, height=200)
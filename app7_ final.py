@@ -1,18 +1,54 @@
 import streamlit as st
-import sqlparse
 import subprocess
 import re
+import string
+import hashlib
 import os
+import pathlib
 import shlex
 import logging
+import threading
 from snowflake.snowpark import Session
 from crewai import BaseLLM, Agent, Task, Crew
+from collections import OrderedDict
 from typing import Union, List, Dict, Any
+from sql_conversion import convert as convert_oracle_sql
+
+# Faster DFA engine for the plain patterns when google-re2 is installed
+try:
+    import re2 as _ENGINE
+except ImportError:
+    _ENGINE = re
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- SQL Validation ---
+_ALLOWED_STATEMENTS = frozenset({'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'})
+# Quoted strings and comments are matched as whole tokens so a ';' inside them never splits.
+_STATEMENT_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"|--[^\n]*|/\*.*?\*/|;", re.DOTALL)
+_FIRST_KEYWORD_RE = re.compile(r'\s*(?:/\*.*?\*/\s*|--[^\n]*(?:\n|$)\s*)*([A-Za-z]+)?', re.DOTALL)
+
+def _split_statements(sql_text):
+    """Splits SQL text on top-level semicolons."""
+    statements, start = [], 0
+    for token in _STATEMENT_TOKEN_RE.finditer(sql_text):
+        if token.group() == ';':
+            statements.append(sql_text[start:token.start()])
+            start = token.end()
+    statements.append(sql_text[start:])
+    return statements
+
+def _statement_type(statement):
+    """Returns the statement's leading keyword, falling back to sqlparse when there is none."""
+    match = _FIRST_KEYWORD_RE.match(statement)
+    if match.group(1):
+        return match.group(1).upper()
+    if match.end() == len(statement):
+        return None  # only whitespace and comments
+    import sqlparse
+    return sqlparse.parse(statement)[0].get_type()
+
 def validate_sql(sql_text):
     """
     Validates SQL syntax and checks for DML statements.
@@ -20,14 +56,13 @@ def validate_sql(sql_text):
     try:
         if not sql_text.strip():
             return False, "Empty or invalid SQL."
-        
-        parsed = sqlparse.parse(sql_text)
-        if not parsed or len(parsed) == 0:
+
+        statement_types = [t for t in map(_statement_type, _split_statements(sql_text)) if t is not None]
+        if not statement_types:
             return False, "Empty or invalid SQL."
 
-        for statement in parsed:
-            statement_type = statement.get_type()
-            if statement_type not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'):
+        for statement_type in statement_types:
+            if statement_type not in _ALLOWED_STATEMENTS:
                 return False, f"Unsupported SQL statement type: {statement_type}. Only DML is allowed."
 
         return True, "SQL syntax looks valid."
@@ -35,46 +70,33 @@ def validate_sql(sql_text):
         return False, f"SQL syntax error: {str(e)}"
 
 # --- Strip DDL Statements ---
+# re2 has no lookarounds and its DFA already skips non-keyword offsets; for the
+# stdlib engine a first-letter lookahead lets sre jump straight to candidates.
+_DDL_PREFIX = r'(?=[cadtgr])' if _ENGINE is re else ''
+_DDL_RE = _ENGINE.compile(r'(?i)' + _DDL_PREFIX + r'(CREATE|ALTER|DROP|TRUNCATE|GRANT|REVOKE)\s+(OR\s+REPLACE\s+)?(VIEW|TABLE|PROCEDURE|FUNCTION|INDEX|SEQUENCE|PACKAGE)\s+[^\n]+\n?')
+_AS_RE = _ENGINE.compile(r'(?i)^AS\s*\n?')
+
 def strip_ddl(sql_text):
     """
     Strips CREATE, ALTER, and DROP statements from the SQL text.
     """
-    sql_text = re.sub(r'(?i)(CREATE|ALTER|DROP|TRUNCATE|GRANT|REVOKE)\s+(OR\s+REPLACE\s+)?(VIEW|TABLE|PROCEDURE|FUNCTION|INDEX|SEQUENCE|PACKAGE)\s+[^\n]+\n?', '', sql_text)
-    sql_text = re.sub(r'(?i)^AS\s*\n?', '', sql_text)
+    sql_text = _DDL_RE.sub('', sql_text)
+    sql_text = _AS_RE.sub('', sql_text)
     return sql_text.strip()
 
 # --- Oracle to Snowflake SQL Conversion (Regex-based) ---
+# Rules live in sql_conversion.py, which handles calls nested inside other calls' arguments.
+# Cheap prescan so already-migrated files skip the rewrite entirely.
+_QUICK_CHECK = _ENGINE.compile(r'(?i)\b(SYSDATE|NVL|DECODE|TO_DATE|TO_CHAR|TO_NUMBER|SUBSTR|ROWNUM)\b|\(\+\)')
+
 def convert_oracle_to_snowflake(sql_text):
     """
-    Converts common Oracle functions and syntax to their Snowflake equivalents.
+    Converts common Oracle functions and syntax to their Snowflake equivalents,
+    including calls nested inside other calls' arguments.
     """
-    sql_text = re.sub(r'\bSYSDATE\b', 'CURRENT_TIMESTAMP', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bNVL\s*\(([^,]+),\s*([^)]+)\)', r'COALESCE(\1, \2)', sql_text, flags=re.IGNORECASE)
-    
-    def decode_to_case(match):
-        args = [arg.strip() for arg in match.group(1).split(',')]
-        if len(args) < 3:
-            return match.group(0)
-        
-        case_statement = f"CASE {args[0]} "
-        for i in range(1, len(args) - 1, 2):
-            case_statement += f"WHEN {args[i]} THEN {args[i+1]} "
-        
-        if len(args) % 2 != 0:
-            case_statement += f"ELSE {args[-1]} "
-            
-        case_statement += "END"
-        return case_statement
-
-    sql_text = re.sub(r'\bDECODE\s*\(([^)]+)\)', decode_to_case, sql_text, flags=re.IGNORECASE)
-
-    sql_text = re.sub(r'\bTO_DATE\s*\(([^,]+),\s*([^)]+)\)', r"TO_DATE(\1, \2)", sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bTO_CHAR\s*\(([^,]+),\s*([^)]+)\)', r"TO_VARCHAR(\1, \2)", sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bTO_NUMBER\s*\(([^)]+)\)', r'TRY_TO_NUMBER(\1)', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bSUBSTR\s*\(([^,]+),\s*([^,]+)(?:,\s*([^)]+))?\)', r'SUBSTRING(\1, \2, \3)', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\(\+\)', '', sql_text)
-    sql_text = re.sub(r'\bROWNUM\s*<=\s*(\d+)', r'LIMIT \1', sql_text, flags=re.IGNORECASE)
-    return sql_text
+    if not _QUICK_CHECK.search(sql_text):
+        return sql_text
+    return convert_oracle_sql(sql_text)
 
 # --- Wrap SQL in DBT Model ---
 def wrap_sql_in_dbt_model(sql_text, model_type):
@@ -82,11 +104,34 @@ def wrap_sql_in_dbt_model(sql_text, model_type):
     config = f"{{{{ config(materialized='{model_type}') }}}}"
     return f"{config}\n\n{sql_text}"
 
+# --- Cached Conversion Pipeline ---
+@st.cache_data(max_entries=256, show_spinner=False)
+def _convert_cached(digest, _sql_content, model_type):
+    """Validates, converts and wraps a SQL file; cached on its content digest."""
+    is_valid, message = validate_sql(_sql_content)
+    if not is_valid:
+        return False, message, None
+    converted_sql = convert_oracle_to_snowflake(_sql_content)
+    return True, message, wrap_sql_in_dbt_model(converted_sql, model_type)
+
+# --- Upload Patterns ---
+class _SafeNameTable(dict):
+    """Maps every character outside the allowed set to an underscore."""
+    def __missing__(self, codepoint):
+        return "_"
+
+_SAFE_NAME_TABLE = _SafeNameTable((ord(ch), ch) for ch in string.ascii_letters + string.digits + "_.")
+
 # --- Snowflake Cortex LLM and CrewAI ---
+CORTEX_CACHE_SIZE = 512
+
 class SnowflakeCortexLLM(BaseLLM):
     def __init__(self, sp_session: Session, model: str = "llama3.1-8b", temperature: float = 0.7):
         super().__init__(model=model, temperature=temperature)
         self.sp_session = sp_session
+        self._cache: OrderedDict[bytes, str] = OrderedDict()
+        self._cache_lock = threading.Lock()  # the LLM is a cache_resource shared by every session
+        self.cache_hits = 0
 
     def call(self, messages: Union[str, List[Dict[str, str]]], **kwargs) -> str:
         try:
@@ -99,13 +144,24 @@ class SnowflakeCortexLLM(BaseLLM):
                 logging.error("❌ Prompt is empty or not provided.")
                 return "Error: No prompt provided."
 
-            safe_prompt = prompt.replace("'", "''")
+            key = hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).digest()
+            with self._cache_lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    self.cache_hits += 1
+                    return self._cache[key]
 
             result_df = self.sp_session.sql(
-                f"SELECT SNOWFLAKE.CORTEX.AI_COMPLETE(model => '{self.model}', prompt => '{safe_prompt}')"
+                "SELECT SNOWFLAKE.CORTEX.AI_COMPLETE(?, ?)", params=[self.model, prompt]
             ).collect()
 
-            return result_df[0][0] if result_df and result_df[0][0] else "No response from Cortex."
+            if not result_df or not result_df[0][0]:
+                return "No response from Cortex."
+            with self._cache_lock:
+                self._cache[key] = result_df[0][0]
+                if len(self._cache) > CORTEX_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+            return result_df[0][0]
         except Exception as e:
             logging.error(f"❌ Error calling Cortex model: {e}")
             return f"Error during model execution: {e}"
@@ -143,6 +199,109 @@ def get_snowpark_session_and_llm():
 
 session, custom_llm = get_snowpark_session_and_llm()
 
+# --- CrewAI Agents ---
+def build_crew_agents(llm):
+    """
+    Builds one set of CrewAI agents for a single Convert run. An agent holds its executor
+    while a task runs, so a set is never cached process-wide or shared between sessions.
+    """
+    oracle_analyst = Agent(role="Oracle PL/SQL Analyst", goal="Analyze and explain the logic of Oracle procedures, functions, packages, and views.", backstory="A seasoned expert in Oracle PL/SQL, meticulously breaking down complex business logic, procedural constructs (BEGIN/END blocks, FOR loops, IF/ELSE statements), and database interactions.", llm=llm, verbose=True)
+    dbt_modeler = Agent(role="Snowflake DBT Modeler", goal="Translate Oracle procedural and declarative logic into clean, efficient, and modular Snowflake dbt models.", backstory="A master of Snowflake SQL and DBT best practices. This agent focuses on converting imperative procedural logic into a single, declarative SQL query that can be run as a dbt model. It understands how to replace procedural constructs with efficient SQL statements.", llm=llm, verbose=True)
+    snowflake_optimizer = Agent(role="Snowflake Optimizer", goal="Refactor and optimize the converted SQL for Snowflake's architecture, ensuring maximum performance.", backstory="A performance engineer with deep knowledge of Snowflake's query engine, ensuring all code runs at peak efficiency. This agent applies best practices like `QUALIFY`, `ROW_NUMBER`, and proper join techniques.", llm=llm, verbose=True)
+    quality_reviewer = Agent(role="SQL Quality Reviewer", goal="Validate the final DBT model for correctness, formatting, and adherence to standards.", backstory="A meticulous reviewer who ensures the final output is production-ready, well-formatted, and follows coding standards.", llm=llm, verbose=True)
+    return oracle_analyst, dbt_modeler, snowflake_optimizer, quality_reviewer
+
+# --- CrewAI Migration ---
+BATCH_NOTE = (
+    "The input contains several files, each delimited by '-- BEGIN FILE: <name>' and "
+    "'-- END FILE: <name>' lines. Convert each file separately and return every model "
+    "wrapped in the same BEGIN/END FILE lines, keeping the original file names.\n"
+)
+_BATCH_FILE_RE = re.compile(r'--\s*BEGIN FILE:\s*(.+?)\s*\n(.*?)--\s*END FILE:\s*\1', re.DOTALL)
+
+def build_migration_crew(agents, source_type, model_type, source_code, status, batched=False):
+    """Builds the four-task CrewAI crew for one file, or for a batch of marked files."""
+    batch_note = BATCH_NOTE if batched else ""
+    oracle_analyst, dbt_modeler, snowflake_optimizer, quality_reviewer = agents
+
+    status.write("🕵️ Analyzing Oracle logic...")
+    task1 = Task(description=f"""
+        Analyze the following Oracle {source_type} code and document its core business logic.
+        The documentation must clearly explain:
+        1. The purpose and a high-level overview of the code.
+        2. Any variables, cursors, or loops used.
+        3. The main data flow, including source tables, filters, joins, and the final output or action.
+        4. How to convert procedural elements like BEGIN/END blocks, FOR loops, and IF/ELSE statements into a single, declarative SELECT statement.
+        Oracle {source_type} code:\n\n{source_code}
+    """, expected_output=f"A clear, structured document explaining the {source_type.lower()}'s logic and a plan for converting it to a declarative SQL query.", agent=oracle_analyst)
+
+    status.write("🤖 Translating to Snowflake SQL...")
+    task2 = Task(description=batch_note + f"""
+        Based on the analysis from the Oracle PL/SQL Analyst, convert the procedural logic into a single DBT model SQL file for Snowflake.
+        The output must be a single, executable SQL SELECT statement that can be materialized as a {model_type}.
+        All procedural constructs (loops, conditional logic, etc.) must be replaced with equivalent declarative SQL (e.g., using CTEs, CASE statements, and set-based logic).
+        Do NOT include any DDL statements (CREATE, ALTER, DROP, etc.) or procedural blocks (BEGIN, END). The output should be pure SQL.
+    """, expected_output="A single, well-formatted DBT model SQL file (a SELECT statement) that can be run on Snowflake.", agent=dbt_modeler)
+
+    status.write("⚙️ Optimizing query for Snowflake...")
+    task3 = Task(description=batch_note + """
+        Given the converted DBT model SQL, review and apply optimizations for Snowflake's architecture.
+        - Optimize joins and WHERE clauses.
+        - Use Snowflake-specific functions where they improve performance.
+        - Ensure the query is efficient for Snowflake's columnar storage and micro-partitioning.
+        The output must be the complete, optimized SQL query.
+    """, expected_output="An optimized DBT model SQL file with Snowflake-specific enhancements.", agent=snowflake_optimizer)
+
+    status.write("✅ Final review and validation complete.")
+    task4 = Task(description=batch_note + """
+        Review the final, optimized DBT model SQL.
+        Check for:
+        - Correctness: Does the SQL logic match the original business logic?
+        - Formatting: Is the code well-indented and easy to read?
+        - Style: Does it follow best practices for dbt and Snowflake?
+        - Final Output: The output should be the final, production-ready SQL.
+    """, expected_output="The final, production-ready DBT model SQL, formatted with correct indentation and comments.", agent=quality_reviewer)
+
+    return Crew(agents=[oracle_analyst, dbt_modeler, snowflake_optimizer, quality_reviewer], tasks=[task1, task2, task3, task4], verbose=True)
+
+def run_batched_migration(files, source_type, model_type):
+    """
+    Groups small files into as few CrewAI runs as the context window allows and
+    returns the converted SQL keyed by file name.
+    """
+    budget = custom_llm.get_context_window_size() // 2
+    batches, current, size = [], [], 0
+    for file in files:
+        block = f"-- BEGIN FILE: {file.name}\n{file.getvalue().decode('utf-8')}\n-- END FILE: {file.name}\n"
+        tokens = len(block) // 4
+        if current and size + tokens > budget:
+            batches.append(current)
+            current, size = [], 0
+        current.append((file.name, block))
+        size += tokens
+    if current:
+        batches.append(current)
+
+    results = {}
+    agents = build_crew_agents(custom_llm)
+    for i, batch in enumerate(batches, start=1):
+        with st.status(f"Using CrewAI to convert batch {i}/{len(batches)} ({len(batch)} files)...", expanded=True) as status:
+            source_code = "".join(block for _, block in batch)
+            crew = build_migration_crew(agents, source_type, model_type, source_code, status, batched=len(batch) > 1)
+            try:
+                llm_result = str(crew.kickoff())
+                status.update(label="Migration complete!", state="complete", expanded=False)
+            except Exception as e:
+                status.update(label="Migration failed.", state="error", expanded=False)
+                st.error(f"❌ CrewAI execution failed: {e}")
+                continue
+        if len(batch) == 1:
+            results[batch[0][0]] = llm_result
+            continue
+        for match in _BATCH_FILE_RE.finditer(llm_result):
+            results[match.group(1)] = match.group(2).strip()
+    return results
+
 with tab1:
     st.markdown("<h1 style='text-align: center; color: #2E86C1;'>🚀 Oracle to Snowflake DBT Migration</h1>", unsafe_allow_html=True)
     st.markdown("### Introduction")
@@ -189,107 +348,86 @@ with tab3:
     
     output_dir = None
     if dbt_path:
-        output_dir = os.path.join(dbt_path, "models", subfolder)
-        os.makedirs(output_dir, exist_ok=True)
+        output_dir = pathlib.Path(dbt_path, "models", subfolder)
     else:
         st.warning("⚠️ Please provide a valid DBT project path to save models.")
     
+    batch_mode = st.checkbox("Batch mode (recommended for small files)", help="Sends several small files to CrewAI in a single run.")
+
     if st.button("🚀 Convert and Save Models"):
         if uploaded_files and output_dir:
-            for file in uploaded_files:
+            output_dir.mkdir(parents=True, exist_ok=True)
+            results = []
+            batched_results = {}
+            if batch_mode and source_type != "SQL File" and custom_llm:
+                batched_results = run_batched_migration(uploaded_files, source_type, model_type)
+            progress = st.progress(0.0, text="Converting…")
+            crew_agents = None  # built on the first CrewAI file and reused for the rest of this run
+            for i, file in enumerate(uploaded_files):
+                progress.progress((i + 1) / len(uploaded_files), text=f"{i + 1}/{len(uploaded_files)}: {file.name}")
                 try:
-                    file_content = file.read().decode("utf-8")
+                    raw_bytes = file.read()
+                    file_content = raw_bytes.decode("utf-8")
                     base_name = os.path.splitext(file.name)[0]
-                    safe_name = re.sub(r'[^a-zA-Z0-9_.]', '_', base_name)
-                    output_filename = os.path.join(output_dir, f"{safe_name}.sql")
+                    safe_name = base_name.translate(_SAFE_NAME_TABLE)
+                    output_filename = output_dir / f"{safe_name}.sql"
                     
                     if source_type == "SQL File":
-                        is_valid, message = validate_sql(file_content)
+                        digest = hashlib.blake2b(raw_bytes, digest_size=16).hexdigest()
+                        is_valid, message, wrapped_sql = _convert_cached(digest, file_content, model_type)
                         if not is_valid:
                             st.error(f"Validation failed for `{file.name}`: {message}")
                             continue
-                        
-                        with st.spinner(f"Converting `{file.name}` using regex..."):
-                            converted_sql = convert_oracle_to_snowflake(file_content)
-                            wrapped_sql = wrap_sql_in_dbt_model(converted_sql, model_type)
                             
                     elif source_type in ["Procedure", "Function", "Package", "View"]:
                         if not custom_llm:
                             st.error("❌ Snowflake Cortex LLM is not initialized. Cannot process this file type.")
                             continue
 
-                        with st.status(f"Using CrewAI to convert `{file.name}`...", expanded=True) as status:
-                            oracle_analyst = Agent(role="Oracle PL/SQL Analyst", goal="Analyze and explain the logic of Oracle procedures, functions, packages, and views.", backstory="A seasoned expert in Oracle PL/SQL, meticulously breaking down complex business logic, procedural constructs (BEGIN/END blocks, FOR loops, IF/ELSE statements), and database interactions.", llm=custom_llm, verbose=True)
-                            dbt_modeler = Agent(role="Snowflake DBT Modeler", goal="Translate Oracle procedural and declarative logic into clean, efficient, and modular Snowflake dbt models.", backstory="A master of Snowflake SQL and DBT best practices. This agent focuses on converting imperative procedural logic into a single, declarative SQL query that can be run as a dbt model. It understands how to replace procedural constructs with efficient SQL statements.", llm=custom_llm, verbose=True)
-                            snowflake_optimizer = Agent(role="Snowflake Optimizer", goal="Refactor and optimize the converted SQL for Snowflake's architecture, ensuring maximum performance.", backstory="A performance engineer with deep knowledge of Snowflake's query engine, ensuring all code runs at peak efficiency. This agent applies best practices like `QUALIFY`, `ROW_NUMBER`, and proper join techniques.", llm=custom_llm, verbose=True)
-                            quality_reviewer = Agent(role="SQL Quality Reviewer", goal="Validate the final DBT model for correctness, formatting, and adherence to standards.", backstory="A meticulous reviewer who ensures the final output is production-ready, well-formatted, and follows coding standards.", llm=custom_llm, verbose=True)
-                            
-                            status.write("🕵️ Analyzing Oracle logic...")
-                            task1 = Task(description=f"""
-                                Analyze the following Oracle {source_type} code and document its core business logic.
-                                The documentation must clearly explain:
-                                1. The purpose and a high-level overview of the code.
-                                2. Any variables, cursors, or loops used.
-                                3. The main data flow, including source tables, filters, joins, and the final output or action.
-                                4. How to convert procedural elements like BEGIN/END blocks, FOR loops, and IF/ELSE statements into a single, declarative SELECT statement.
-                                Oracle {source_type} code:\n\n{file_content}
-                            """, expected_output=f"A clear, structured document explaining the {source_type.lower()}'s logic and a plan for converting it to a declarative SQL query.", agent=oracle_analyst)
-
-                            status.write("🤖 Translating to Snowflake SQL...")
-                            task2 = Task(description=f"""
-                                Based on the analysis from the Oracle PL/SQL Analyst, convert the procedural logic into a single DBT model SQL file for Snowflake.
-                                The output must be a single, executable SQL SELECT statement that can be materialized as a {model_type}.
-                                All procedural constructs (loops, conditional logic, etc.) must be replaced with equivalent declarative SQL (e.g., using CTEs, CASE statements, and set-based logic).
-                                Do NOT include any DDL statements (CREATE, ALTER, DROP, etc.) or procedural blocks (BEGIN, END). The output should be pure SQL.
-                            """, expected_output="A single, well-formatted DBT model SQL file (a SELECT statement) that can be run on Snowflake.", agent=dbt_modeler)
-
-                            status.write("⚙️ Optimizing query for Snowflake...")
-                            task3 = Task(description="""
-                                Given the converted DBT model SQL, review and apply optimizations for Snowflake's architecture.
-                                - Optimize joins and WHERE clauses.
-                                - Use Snowflake-specific functions where they improve performance.
-                                - Ensure the query is efficient for Snowflake's columnar storage and micro-partitioning.
-                                The output must be the complete, optimized SQL query.
-                            """, expected_output="An optimized DBT model SQL file with Snowflake-specific enhancements.", agent=snowflake_optimizer)
-                            
-                            status.write("✅ Final review and validation complete.")
-                            task4 = Task(description="""
-                                Review the final, optimized DBT model SQL.
-                                Check for:
-                                - Correctness: Does the SQL logic match the original business logic?
-                                - Formatting: Is the code well-indented and easy to read?
-                                - Style: Does it follow best practices for dbt and Snowflake?
-                                - Final Output: The output should be the final, production-ready SQL.
-                            """, expected_output="The final, production-ready DBT model SQL, formatted with correct indentation and comments.", agent=quality_reviewer)
-                            
-                            crew = Crew(agents=[oracle_analyst, dbt_modeler, snowflake_optimizer, quality_reviewer], tasks=[task1, task2, task3, task4], verbose=2)
-                            
-                            try:
-                                llm_result = crew.kickoff()
-                                wrapped_sql = wrap_sql_in_dbt_model(str(llm_result), model_type)
-                                status.update(label="Migration complete!", state="complete", expanded=False)
-                            except Exception as e:
-                                status.update(label="Migration failed.", state="error", expanded=False)
-                                st.error(f"❌ CrewAI execution failed: {e}")
+                        if batch_mode:
+                            if file.name not in batched_results:
+                                st.error(f"❌ `{file.name}` was not found in the batch output.")
                                 continue
+                            wrapped_sql = wrap_sql_in_dbt_model(batched_results[file.name], model_type)
+                        else:
+                            if crew_agents is None:
+                                crew_agents = build_crew_agents(custom_llm)
+                            with st.status(f"Using CrewAI to convert `{file.name}`...", expanded=True) as status:
+                                crew = build_migration_crew(crew_agents, source_type, model_type, file_content, status)
+                            
+                                try:
+                                    llm_result = crew.kickoff()
+                                    wrapped_sql = wrap_sql_in_dbt_model(str(llm_result), model_type)
+                                    status.update(label="Migration complete!", state="complete", expanded=False)
+                                except Exception as e:
+                                    status.update(label="Migration failed.", state="error", expanded=False)
+                                    st.error(f"❌ CrewAI execution failed: {e}")
+                                    continue
                     
-                    with open(output_filename, "w") as f:
-                        f.write(wrapped_sql)
+                    wrapped_bytes = wrapped_sql.encode("utf-8")
+                    output_filename.write_bytes(wrapped_bytes)
                     
-                    st.markdown("### Converted SQL")
+                    results.append((file.name, file_content, wrapped_sql, output_filename, safe_name, wrapped_bytes))
+                except Exception as e:
+                    st.error(f"❌ Error processing `{file.name}`: {str(e)}")
+            progress.empty()
+
+            # Render every converted file in one pass after all conversions have finished.
+            if results:
+                st.markdown("### Converted SQL")
+            for name, original_sql, wrapped_sql, output_filename, safe_name, wrapped_bytes in results:
+                with st.expander(f"`{name}`"):
                     col1, col2 = st.columns(2)
                     with col1:
-                        st.markdown(f"#### 📥 Original Oracle Code for `{file.name}`")
-                        st.code(file_content, language="sql")
+                        st.markdown(f"#### 📥 Original Oracle Code for `{name}`")
+                        st.code(original_sql, language="sql")
                     with col2:
                         st.markdown(f"#### 📤 Converted Snowflake DBT Model")
                         st.code(wrapped_sql, language="sql")
-                    
-                    with open(output_filename, "rb") as f:
-                        st.download_button(label=f"⬇️ Download `{safe_name}.sql`", data=f, file_name=f"{safe_name}.sql", mime="text/sql")
-                    
+                    st.download_button(label=f"⬇️ Download `{safe_name}.sql`", data=wrapped_bytes, file_name=f"{safe_name}.sql", mime="text/sql")
                     st.success(f"✅ Saved to `{output_filename}`")
-                except Exception as e:
-                    st.error(f"❌ Error processing `{file.name}`: {str(e)}")
         else:
             st.warning("⚠️ Please upload at least one file and provide a valid DBT path.")
+
+if custom_llm:
+    st.sidebar.metric("Cortex cache hits", custom_llm.cache_hits)
@@ -2,24 +2,41 @@ import streamlit as st
 import sqlparse
 import re
 import os
+import io
+import hashlib
+import zipfile
 import logging
+import threading
+import pathlib
+import functools
+import queue
+from logging.handlers import MemoryHandler
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from snowflake.snowpark import Session
 from crewai import BaseLLM, Agent, Task, Crew
+from collections import OrderedDict
 from typing import Union, List, Dict, Any
+from sql_conversion import convert as convert_oracle_sql
 
 # Ensure log directory exists
 log_dir = "logs"
 os.makedirs(log_dir, exist_ok=True)
 
-# Configure logging globally
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(log_dir, 'app.log'), mode='a'),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging globally; file records are buffered and written in batches.
+# Cached so Streamlit reruns reuse the attached handler instead of opening a new, orphaned one.
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+@st.cache_resource
+def _configure_logging():
+    file_handler = logging.FileHandler(os.path.join(log_dir, 'app.log'), mode='a')
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_buffer = MemoryHandler(capacity=256, flushLevel=logging.ERROR, target=file_handler)
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, handlers=[logging.StreamHandler()])
+    # Attached directly: basicConfig does nothing once root has handlers
+    logging.getLogger().addHandler(log_buffer)
+    return log_buffer
+
+_log_buffer = _configure_logging()
 
 # -- CSS code to remove top space
 st.markdown(
@@ -37,6 +54,30 @@ st.markdown(
 )
 
 # --- SQL Validation and Cleaning ---
+_ALLOWED_STATEMENTS = frozenset({'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'})
+# Quoted strings and comments are matched as whole tokens so a ';' inside them never splits.
+_STATEMENT_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"|--[^\n]*|/\*.*?\*/|;", re.DOTALL)
+_FIRST_KEYWORD_RE = re.compile(r'\s*(?:/\*.*?\*/\s*|--[^\n]*(?:\n|$)\s*)*([A-Za-z]+)?', re.DOTALL)
+
+def _split_statements(sql_text):
+    """Splits SQL text on top-level semicolons."""
+    statements, start = [], 0
+    for token in _STATEMENT_TOKEN_RE.finditer(sql_text):
+        if token.group() == ';':
+            statements.append(sql_text[start:token.start()])
+            start = token.end()
+    statements.append(sql_text[start:])
+    return statements
+
+def _statement_type(statement):
+    """Returns the statement's leading keyword, falling back to sqlparse when there is none."""
+    match = _FIRST_KEYWORD_RE.match(statement)
+    if match.group(1):
+        return match.group(1).upper()
+    if match.end() == len(statement):
+        return None  # only whitespace and comments
+    return sqlparse.parse(statement)[0].get_type()
+
 def validate_sql(sql_text):
     """Validates SQL syntax and checks for DML statements."""
     logging.info("Starting SQL validation...")
@@ -45,13 +86,13 @@ def validate_sql(sql_text):
             logging.warning("Empty or invalid SQL text provided.")
             return False, "Empty or invalid SQL."
         
-        parsed = sqlparse.parse(sql_text)
-        if not parsed or len(parsed) == 0:
+        # Only each statement's leading keyword is needed, so no full parse tree is built.
+        statement_types = [t for t in map(_statement_type, _split_statements(sql_text)) if t is not None]
+        if not statement_types:
             logging.warning("SQL parsing resulted in no statements.")
             return False, "Empty or invalid SQL."
 
-        for statement in parsed:
-            statement_type = statement.get_type()
+        for statement_type in statement_types:
             if statement_type not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'):
                 logging.error(f"Unsupported SQL statement type: {statement_type}.")
                 return False, f"Unsupported SQL statement type: {statement_type}. Only DML is allowed."
@@ -62,62 +103,68 @@ def validate_sql(sql_text):
         logging.error(f"SQL validation failed due to an exception: {e}")
         return False, f"SQL syntax error: {str(e)}"
 
+# Rewrite rules live in sql_conversion.py, shared with the other migration apps.
 def convert_oracle_to_snowflake(sql_text):
     """Converts common Oracle functions and syntax to their Snowflake equivalents."""
     logging.info("Starting Oracle to Snowflake syntax conversion...")
-    sql_text = re.sub(r'\bSYSDATE\b', 'CURRENT_TIMESTAMP', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bNVL\s*\(([^,]+),\s*([^)]+)\)', r'COALESCE(\1, \2)', sql_text, flags=re.IGNORECASE)
-    
-    def decode_to_case(match):
-        args = [arg.strip() for arg in match.group(1).split(',')]
-        if len(args) < 3:
-            return match.group(0)
-        
-        case_statement = f"CASE {args[0]} "
-        for i in range(1, len(args) - 1, 2):
-            case_statement += f"WHEN {args[i]} THEN {args[i+1]} "
-        
-        if len(args) % 2 != 0:
-            case_statement += f"ELSE {args[-1]} "
-            
-        case_statement += "END"
-        return case_statement
-
-    sql_text = re.sub(r'\bDECODE\s*\(([^)]+)\)', decode_to_case, sql_text, flags=re.IGNORECASE)
-
-    sql_text = re.sub(r'\bTO_DATE\s*\(([^,]+),\s*([^)]+)\)', r"TO_DATE(\1, \2)", sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bTO_CHAR\s*\(([^,]+),\s*([^)]+)\)', r"TO_VARCHAR(\1, \2)", sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bTO_NUMBER\s*\(([^)]+)\)', r'TRY_TO_NUMBER(\1)', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bSUBSTR\s*\(([^,]+),\s*([^,]+)(?:,\s*([^)]+))?\)', r'SUBSTRING(\1, \2, \3)', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\(\+\)', '', sql_text)
-    sql_text = re.sub(r'\bROWNUM\s*<=\s*(\d+)', r'LIMIT \1', sql_text, flags=re.IGNORECASE)
+    sql_text = convert_oracle_sql(sql_text)
     logging.info("Conversion completed.")
     return sql_text
 
+# Duplicate uploads (templates, re-runs) reuse earlier results, keyed on the SQL text.
+# Plain lru_cache rather than st.cache_data: these run on pool threads with no ScriptRunContext.
+@functools.lru_cache(maxsize=512)
+def _validate_cached(sql_text):
+    return validate_sql(sql_text)
+
+@functools.lru_cache(maxsize=512)
+def _convert_cached(sql_text):
+    return convert_oracle_to_snowflake(sql_text)
+
+# Uploads above this size skip the result caches (which would keep extra copies of the text)
+# and are converted one statement at a time.
+LARGE_UPLOAD_BYTES = 2 * 1024 * 1024
+
+def convert_by_statement(sql_text):
+    """Converts each top-level statement separately, so rewrite intermediates stay statement-sized."""
+    return ";".join(convert_oracle_to_snowflake(statement) for statement in _split_statements(sql_text))
+
 def wrap_sql_in_dbt_model(sql_text, model_type):
     """Wraps the SQL in a DBT config block."""
     logging.info("Wrapping SQL in DBT model config...")
     config = f"{{{{ config(materialized='{model_type}') }}}}"
     return f"{config}\n\n{sql_text}"
 
+_summary_lock = threading.Lock()
+
 def create_summary_file(output_dir, file_name, model_type, oracle_logic_summary):
     """Creates a summary file with migration details, excluding the converted SQL code."""
     summary_path = os.path.join(output_dir, "summary.txt")
-    with open(summary_path, "w") as f:
-        f.write("--- Migration Summary Report ---\n\n")
-        f.write(f"File Name: {file_name}\n")
-        f.write(f"DBT Model Type: {model_type}\n")
-        f.write("\n--- Oracle Code Analysis ---\n")
-        f.write(oracle_logic_summary)
+    report = (
+        "--- Migration Summary Report ---\n\n"
+        f"File Name: {file_name}\n"
+        f"DBT Model Type: {model_type}\n"
+        "\n--- Oracle Code Analysis ---\n"
+        f"{oracle_logic_summary}"
+    )
+    with _summary_lock:
+        pathlib.Path(summary_path).write_text(report)
     logging.info(f"Summary file created at {summary_path}")
     return summary_path
 
 # --- Snowflake Cortex LLM and CrewAI ---
+CORTEX_CACHE_SIZE = 1024
+# CrewAI's verbose output is formatted per step and captured by Streamlit; opt in with CREW_DEBUG=1.
+CREW_VERBOSE = os.environ.get('CREW_DEBUG') == '1'
+
 class SnowflakeCortexLLM(BaseLLM):
     """Custom LLM class to integrate with Snowflake Cortex AI."""
     def __init__(self, sp_session: Session, model: str = "llama3.1-8b"):
         super().__init__(model=model)
         self.sp_session = sp_session
+        # LRU of responses keyed on (model, prompt hash); lives as long as the cached LLM.
+        self._cache: OrderedDict[tuple, str] = OrderedDict()
+        self._cache_lock = threading.Lock()  # files are converted on worker threads
 
     def call(self, messages: Union[str, List[Dict[str, str]]], **kwargs) -> str:
         try:
@@ -130,15 +177,28 @@ class SnowflakeCortexLLM(BaseLLM):
                 logging.error("❌ Prompt is empty or not provided.")
                 return "Error: No prompt provided."
 
-            safe_prompt = prompt.replace("'", "''")
-            logging.debug(f"Calling Cortex with prompt: {safe_prompt[:100]}...")
+            key = (self.model, hashlib.sha256(prompt.encode("utf-8")).digest())
+            with self._cache_lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    logging.debug("Cortex response served from cache.")
+                    return self._cache[key]
 
+            logging.debug(f"Calling Cortex with prompt: {prompt[:100]}...")
+
+            # Bound parameters: no quote escaping, and the prompt is never parsed as SQL text.
             result_df = self.sp_session.sql(
-                f"SELECT SNOWFLAKE.CORTEX.AI_COMPLETE(model => '{self.model}', prompt => '{safe_prompt}')"
+                "SELECT SNOWFLAKE.CORTEX.AI_COMPLETE(model => ?, prompt => ?)", params=[self.model, prompt]
             ).collect()
             
-            response = result_df[0][0] if result_df and result_df[0][0] else "No response from Cortex."
+            if not result_df or not result_df[0][0]:
+                return "No response from Cortex."
+            response = result_df[0][0]
             logging.debug(f"Cortex response received: {response[:100]}...")
+            with self._cache_lock:
+                self._cache[key] = response
+                if len(self._cache) > CORTEX_CACHE_SIZE:
+                    self._cache.popitem(last=False)
             return response
         except Exception as e:
             logging.error(f"❌ Error calling Cortex model: {e}")
@@ -173,6 +233,133 @@ def get_snowpark_session_and_llm():
         st.error(f"❌ Failed to create Snowflake session or LLM. Please check your connection parameters. Error: {e}")
         logging.critical(f"Failed to create Snowflake session: {e}")
         return None, None
+# --- Per-File Migration ---
+# Agents are the same for every file, so one set is built per worker on the script thread
+# and handed out through a queue; no two concurrent crews share an agent.
+def _build_agents(llm):
+    return {
+        "oracle_analyst": Agent(role="Oracle PL/SQL Analyst", goal="Analyze and explain the logic of Oracle procedures, functions, packages, and views.", backstory="A seasoned expert in Oracle PL/SQL, meticulously breaking down complex business logic, procedural constructs (BEGIN/END blocks, FOR loops, IF/ELSE statements), and database interactions.", llm=llm, verbose=CREW_VERBOSE),
+        "dbt_modeler": Agent(role="Snowflake DBT Modeler", goal="Translate Oracle procedural and declarative logic into clean, efficient, and modular Snowflake dbt models.", backstory="A master of Snowflake SQL and DBT best practices. This agent focuses on converting imperative procedural logic into a single, declarative SQL query that can be run as a dbt model. It understands how to replace procedural constructs with efficient SQL statements.", llm=llm, verbose=CREW_VERBOSE),
+        "snowflake_optimizer": Agent(role="Snowflake Optimizer", goal="Refactor and optimize the converted SQL for Snowflake's architecture, ensuring maximum performance.", backstory="A performance engineer with deep knowledge of Snowflake's query engine, ensuring all code runs at peak efficiency. This agent applies best practices like `QUALIFY`, `ROW_NUMBER`, and proper join techniques.", llm=llm, verbose=CREW_VERBOSE),
+        "quality_reviewer": Agent(role="SQL Quality Reviewer", goal="Validate the final DBT model for correctness, formatting, and adherence to standards.", backstory="A meticulous reviewer who ensures the final output is production-ready, well-formatted, and follows coding standards.", llm=llm, verbose=CREW_VERBOSE),
+    }
+
+# Literal escape sequences the LLM sometimes emits; one pass so "\\\\n" stays a backslash + n.
+_LITERAL_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "'": "'", '"': '"', "\\": "\\"}
+_LITERAL_ESCAPE_RE = re.compile(r'\\([ntr\'"\\])')
+
+def _run_crew(agents, file_content, source_type, model_type):
+    """Runs the four-step crew for one file with a worker's agent set."""
+    oracle_analyst, dbt_modeler = agents["oracle_analyst"], agents["dbt_modeler"]
+    snowflake_optimizer, quality_reviewer = agents["snowflake_optimizer"], agents["quality_reviewer"]
+
+    task1 = Task(description=f"""
+        Analyze the following Oracle {source_type} code and document its core business logic.
+        The documentation must clearly explain:
+        1. The purpose and a high-level overview of the code.
+        2. Any variables, cursors, or loops used.
+        3. The main data flow, including source tables, filters, joins, and the final output or action.
+        4. How to convert procedural elements like BEGIN/END blocks, FOR loops, and IF/ELSE statements into a single, declarative SELECT statement.
+        Oracle {source_type} code:\n\n{file_content}
+    """, expected_output=f"A clear, structured document explaining the {source_type.lower()}'s logic and a plan for converting it to a declarative SQL query.", agent=oracle_analyst)
+
+    task2 = Task(description=f"""
+        Based on the analysis from the Oracle PL/SQL Analyst, convert the procedural logic into a single DBT model SQL file for Snowflake.
+        The output must be a single, executable SQL SELECT statement that can be materialized as a {model_type}.
+        All procedural constructs (loops, conditional logic, etc.) must be replaced with equivalent declarative SQL (e.g., using CTEs, CASE statements, and set-based logic).
+        Do NOT include any DDL statements (CREATE, ALTER, DROP, etc.) or procedural blocks (BEGIN, END). The output should be pure SQL.
+    """, expected_output="A single, well-formatted DBT model SQL file (a SELECT statement) that can be run on Snowflake.", agent=dbt_modeler)
+
+    task3 = Task(description="""
+        Given the converted DBT model SQL, review and apply optimizations for Snowflake's architecture.
+        - Optimize joins and WHERE clauses.
+        - Use Snowflake-specific functions where they improve performance.
+        - Ensure the query is efficient for Snowflake's columnar storage and micro-partitioning.
+        The output must be the complete, optimized SQL query.
+    """, expected_output="An optimized DBT model SQL file with Snowflake-specific enhancements.", agent=snowflake_optimizer)
+
+    task4 = Task(description="""
+        Review the final, optimized DBT model SQL.
+        Check for:
+        - Correctness: Does the SQL logic match the original business logic?
+        - Formatting: Is the code well-indented and easy to read?
+        - Style: Does it follow best practices for dbt and Snowflake?
+        - Final Output: The output should be the final, production-ready SQL.
+    """, expected_output="The final, production-ready DBT model SQL, formatted with correct indentation and comments.", agent=quality_reviewer)
+
+    crew = Crew(agents=[oracle_analyst, dbt_modeler, snowflake_optimizer, quality_reviewer], tasks=[task1, task2, task3, task4], verbose=CREW_VERBOSE)
+
+    llm_result = crew.kickoff()
+    return llm_result, crew
+
+def build_agent_pool(llm, workers):
+    agent_pool = queue.Queue()
+    for _ in range(workers):
+        agent_pool.put(_build_agents(llm))
+    return agent_pool
+
+def process_uploaded_file(file, source_type, model_type, output_dir, log_dir, custom_llm, agent_pool):
+    """
+    Converts and saves one upload. Runs on a worker thread, so it makes no
+    Streamlit calls; failures are raised and reported by the caller.
+    """
+    # Decoding through a text wrapper avoids holding a second, bytes copy of the upload;
+    # newline="" keeps CRLF line endings so the saved model bytes are unchanged.
+    text_stream = io.TextIOWrapper(file, encoding="utf-8", newline="")
+    file_content = text_stream.read()
+    text_stream.detach()
+    is_large = file.size > LARGE_UPLOAD_BYTES
+    base_name = os.path.splitext(file.name)[0]
+    safe_name = re.sub(r'[^a-zA-Z0-9_.]', '_', base_name)
+    output_filename = os.path.join(output_dir, f"{safe_name}.sql")
+
+    if source_type == "SQL File":
+        is_valid, message = validate_sql(file_content) if is_large else _validate_cached(file_content)
+        if not is_valid:
+            raise ValueError(f"Validation failed: {message}")
+        converted_sql = convert_by_statement(file_content) if is_large else _convert_cached(file_content)
+        wrapped_sql = wrap_sql_in_dbt_model(converted_sql, model_type)
+    else:
+        if not custom_llm:
+            raise RuntimeError("Snowflake Cortex LLM is not initialized. Cannot process this file type.")
+
+        agents = agent_pool.get()
+        try:
+            llm_result, crew = _run_crew(agents, file_content, source_type, model_type)
+        finally:
+            agent_pool.put(agents)
+
+        logging.info("CrewAI execution completed.")
+
+        final_output_str = llm_result.get('final_task_output', '') if isinstance(llm_result, dict) else str(llm_result)
+        logging.debug(f"Raw AI Output: {final_output_str}")
+
+        if hasattr(crew, 'tasks_outputs') and crew.tasks_outputs:
+            oracle_logic_summary = crew.tasks_outputs[0]
+        else:
+            oracle_logic_summary = "No summary available."
+
+        # An unclosed fence finds no match, so the whole output is used rather than raising.
+        fence_match = None
+        if "```sql" in final_output_str:
+            fence_match = re.search(r"```sql\s*(.*?)\s*```", final_output_str, re.DOTALL)
+        elif "```" in final_output_str:
+            fence_match = re.search(r"```\s*(.*?)\s*```", final_output_str, re.DOTALL)
+        clean_sql = fence_match.group(1) if fence_match else final_output_str.strip()
+
+        clean_sql = _LITERAL_ESCAPE_RE.sub(lambda m: _LITERAL_ESCAPES[m.group(1)], clean_sql)
+        logging.info("Unescaped literal escape sequences.")
+        logging.debug(f"Cleaned and decoded SQL:\n{clean_sql}")
+
+        converted_sql = _convert_cached(clean_sql)
+        wrapped_sql = wrap_sql_in_dbt_model(converted_sql, model_type)
+
+        create_summary_file(log_dir, file.name, model_type, oracle_logic_summary)
+
+    with open(output_filename, "w") as f:
+        f.write(wrapped_sql)
+    return file_content, wrapped_sql, output_filename, safe_name
+
 st.set_page_config(page_title="Oracle to Snowflake DBT Migration", layout="wide")
 st.markdown("<h1 style='text-align: center; color: #2E86C1;'>🚀 Oracle to Snowflake DBT Migration</h1>", unsafe_allow_html=True)
 tab1, tab2, tab3 = st.tabs(["🏠 Home", "⚙️ Environment Setup", "📁 Migration Settings"])
@@ -247,117 +434,44 @@ with tab3:
     if st.button("🚀 Convert and Save Models"):
         if uploaded_files and output_dir:
             total_files = len(uploaded_files)
-            for i, file in enumerate(uploaded_files):
-                st.subheader(f"Processing file {i+1} of {total_files}: `{file.name}`")
-                
-                try:
-                    file_content = file.read().decode("utf-8")
-                    base_name = os.path.splitext(file.name)[0]
-                    safe_name = re.sub(r'[^a-zA-Z0-9_.]', '_', base_name)
-                    output_filename = os.path.join(output_dir, f"{safe_name}.sql")
-                    
-                    if source_type == "SQL File":
-                        is_valid, message = validate_sql(file_content)
-                        if not is_valid:
-                            st.error(f"Validation failed for `{file.name}`: {message}")
-                            continue
-                        
-                        with st.spinner(f"Converting `{file.name}` using regex..."):
-                            converted_sql = convert_oracle_to_snowflake(file_content)
-                            wrapped_sql = wrap_sql_in_dbt_model(converted_sql, model_type)
-                            
-                    elif source_type in ["Procedure", "Function", "Package", "View"]:
-                        if not custom_llm:
-                            st.error("❌ Snowflake Cortex LLM is not initialized. Cannot process this file type.")
-                            continue
-
-                        with st.status(f"Using CrewAI to convert `{file.name}`...", expanded=True) as status:
-                            oracle_analyst = Agent(role="Oracle PL/SQL Analyst", goal="Analyze and explain the logic of Oracle procedures, functions, packages, and views.", backstory="A seasoned expert in Oracle PL/SQL, meticulously breaking down complex business logic, procedural constructs (BEGIN/END blocks, FOR loops, IF/ELSE statements), and database interactions.", llm=custom_llm, verbose=True)
-                            dbt_modeler = Agent(role="Snowflake DBT Modeler", goal="Translate Oracle procedural and declarative logic into clean, efficient, and modular Snowflake dbt models.", backstory="A master of Snowflake SQL and DBT best practices. This agent focuses on converting imperative procedural logic into a single, declarative SQL query that can be run as a dbt model. It understands how to replace procedural constructs with efficient SQL statements.", llm=custom_llm, verbose=True)
-                            snowflake_optimizer = Agent(role="Snowflake Optimizer", goal="Refactor and optimize the converted SQL for Snowflake's architecture, ensuring maximum performance.", backstory="A performance engineer with deep knowledge of Snowflake's query engine, ensuring all code runs at peak efficiency. This agent applies best practices like `QUALIFY`, `ROW_NUMBER`, and proper join techniques.", llm=custom_llm, verbose=True)
-                            quality_reviewer = Agent(role="SQL Quality Reviewer", goal="Validate the final DBT model for correctness, formatting, and adherence to standards.", backstory="A meticulous reviewer who ensures the final output is production-ready, well-formatted, and follows coding standards.", llm=custom_llm, verbose=True)
-
-                            status.update(label="🕵️ **Step 1/4: Analyzing Oracle logic...**", state="running", expanded=True)
-                            task1 = Task(description=f"""
-                                Analyze the following Oracle {source_type} code and document its core business logic.
-                                The documentation must clearly explain:
-                                1. The purpose and a high-level overview of the code.
-                                2. Any variables, cursors, or loops used.
-                                3. The main data flow, including source tables, filters, joins, and the final output or action.
-                                4. How to convert procedural elements like BEGIN/END blocks, FOR loops, and IF/ELSE statements into a single, declarative SELECT statement.
-                                Oracle {source_type} code:\n\n{file_content}
-                            """, expected_output=f"A clear, structured document explaining the {source_type.lower()}'s logic and a plan for converting it to a declarative SQL query.", agent=oracle_analyst)
-                            
-                            status.update(label="🤖 **Step 2/4: Translating to Snowflake SQL...**", state="running", expanded=True)
-                            task2 = Task(description=f"""
-                                Based on the analysis from the Oracle PL/SQL Analyst, convert the procedural logic into a single DBT model SQL file for Snowflake.
-                                The output must be a single, executable SQL SELECT statement that can be materialized as a {model_type}.
-                                All procedural constructs (loops, conditional logic, etc.) must be replaced with equivalent declarative SQL (e.g., using CTEs, CASE statements, and set-based logic).
-                                Do NOT include any DDL statements (CREATE, ALTER, DROP, etc.) or procedural blocks (BEGIN, END). The output should be pure SQL.
-                            """, expected_output="A single, well-formatted DBT model SQL file (a SELECT statement) that can be run on Snowflake.", agent=dbt_modeler)
-                            
-                            status.update(label="⚙️ **Step 3/4: Optimizing query for Snowflake...**", state="running", expanded=True)
-                            task3 = Task(description="""
-                                Given the converted DBT model SQL, review and apply optimizations for Snowflake's architecture.
-                                - Optimize joins and WHERE clauses.
-                                - Use Snowflake-specific functions where they improve performance.
-                                - Ensure the query is efficient for Snowflake's columnar storage and micro-partitioning.
-                                The output must be the complete, optimized SQL query.
-                            """, expected_output="An optimized DBT model SQL file with Snowflake-specific enhancements.", agent=snowflake_optimizer)
-                            
-                            status.update(label="✅ **Step 4/4: Final review and validation complete...**", state="running", expanded=True)
-                            task4 = Task(description="""
-                                Review the final, optimized DBT model SQL.
-                                Check for:
-                                - Correctness: Does the SQL logic match the original business logic?
-                                - Formatting: Is the code well-indented and easy to read?
-                                - Style: Does it follow best practices for dbt and Snowflake?
-                                - Final Output: The output should be the final, production-ready SQL.
-                            """, expected_output="The final, production-ready DBT model SQL, formatted with correct indentation and comments.", agent=quality_reviewer)
-                            
-                            crew = Crew(agents=[oracle_analyst, dbt_modeler, snowflake_optimizer, quality_reviewer], tasks=[task1, task2, task3, task4], verbose=True)
-                            
-                            try:
-                                llm_result = crew.kickoff()
-                                logging.info("CrewAI execution completed.")
-                                
-                                final_output_str = llm_result.get('final_task_output', '') if isinstance(llm_result, dict) else str(llm_result)
-                                logging.debug(f"Raw AI Output: {final_output_str}")
-
-                                if hasattr(crew, 'tasks_outputs') and crew.tasks_outputs:
-                                    oracle_logic_summary = crew.tasks_outputs[0]
-                                else:
-                                    oracle_logic_summary = "No summary available."
-
-                                clean_sql = ""
-                                if "```sql" in final_output_str:
-                                    clean_sql = re.search(r"```sql\s*(.*?)\s*```", final_output_str, re.DOTALL).group(1)
-                                elif "```" in final_output_str:
-                                    clean_sql = re.search(r"```\s*(.*?)\s*```", final_output_str, re.DOTALL).group(1)
-                                else:
-                                    clean_sql = final_output_str.strip()
-                                
-                                clean_sql = clean_sql.encode('utf-8').decode('unicode_escape')
-                                logging.info("Decoded literal escape sequences.")
-                                logging.debug(f"Cleaned and decoded SQL:\n{clean_sql}")
-
-                                converted_sql = convert_oracle_to_snowflake(clean_sql)
-                                wrapped_sql = wrap_sql_in_dbt_model(converted_sql, model_type)
-                                
-                                create_summary_file(log_dir, file.name, model_type, oracle_logic_summary)
-                                
-                                status.update(label="✅ **Migration complete!**", state="complete", expanded=False)
-                            except Exception as e:
-                                logging.critical(f"CrewAI execution failed with an exception: {e}")
-                                status.update(label="❌ **Migration failed.**", state="error", expanded=False)
-                                st.error(f"❌ CrewAI execution failed: {e}")
-                                continue
-                    with open(output_filename, "w") as f:
-                        f.write(wrapped_sql)
-                    
+            results, errors = {}, {}
+            # Each file is mostly waiting on Cortex, so files run side by side;
+            # all Streamlit output stays on this thread.
+            workers = min(8, total_files)
+            agent_pool = build_agent_pool(custom_llm, workers) if custom_llm and source_type != "SQL File" else None
+            with st.status(f"Converting {total_files} file(s)...", expanded=True) as status:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    futures = {
+                        pool.submit(process_uploaded_file, file, source_type, model_type, output_dir, log_dir, custom_llm, agent_pool): (i, file)
+                        for i, file in enumerate(uploaded_files)
+                    }
+                    for done, future in enumerate(as_completed(futures), start=1):
+                        i, file = futures[future]
+                        try:
+                            results[i] = future.result()
+                            status.write(f"✅ {done}/{total_files}: `{file.name}`")
+                        except Exception as e:
+                            logging.critical(f"Processing `{file.name}` failed: {e}")
+                            status.write(f"❌ {done}/{total_files}: `{file.name}`")
+                            errors[i] = f"❌ Error processing `{file.name}`: {str(e)}"
+                        _log_buffer.flush()
+                if errors:
+                    status.update(label=f"⚠️ **Migration finished with {len(errors)} of {total_files} file(s) failed.**", state="error", expanded=False)
+                else:
+                    status.update(label="✅ **Migration complete!**", state="complete", expanded=False)
+
+            # Rendered in upload order once every file has finished, outside the collapsed status.
+            for i in sorted(errors):
+                st.error(errors[i])
+            zip_buffer = io.BytesIO()
+            with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+                for i, file in enumerate(uploaded_files):
+                    if i not in results:
+                        continue
+                    file_content, wrapped_sql, output_filename, safe_name = results[i]
                     st.success(f"✅ Converted and saved to `{output_filename}`")
-                    
-                    with st.expander("View Original and Converted Code"):
+                
+                    with st.expander(f"View Original and Converted Code for `{file.name}`"):
                         col1, col2 = st.columns(2)
                         with col1:
                             st.markdown(f"#### 📥 Original Oracle Code for `{file.name}`")
@@ -366,10 +480,10 @@ with tab3:
                             st.markdown(f"#### 📤 Converted Snowflake DBT Model")
                             st.code(wrapped_sql, language="sql")
 
-                    with open(output_filename, "rb") as f:
-                        st.download_button(label=f"⬇️ Download `{safe_name}.sql`", data=f, file_name=f"{safe_name}.sql", mime="text/sql")
-                except Exception as e:
-                    st.error(f"❌ Error processing `{file.name}`: {str(e)}")
+                    archive.writestr(f"{safe_name}.sql", wrapped_sql)
+
+            if results:
+                st.download_button(label=f"⬇️ Download all ({len(results)} models)", data=zip_buffer.getvalue(), file_name="migration.zip", mime="application/zip")
         else:
             st.warning("⚠️ Please upload at least one file and provide a valid DBT path.")
 
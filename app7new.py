@@ -1,23 +1,46 @@
 import streamlit as st
 import sqlparse
 import subprocess
-import re
+# Drop-in faster matcher when the third-party regex package is installed
+try:
+    import regex as re
+except ImportError:
+    import re
 import os
+import string
+from concurrent.futures import ThreadPoolExecutor
+from sql_conversion import convert as convert_oracle_sql
+import io
+import pathlib
 import uuid
-import shlex
 
 # --- SQL Validation ---
-def validate_sql(sql_text):
-    """Validates SQL syntax and checks for DDL statements."""
+_DDL_KEYWORDS = ("CREATE", "ALTER", "DROP", "TRUNCATE", "GRANT", "REVOKE")
+_DDL_RE = re.compile(r'\b(?:CREATE|ALTER|DROP|TRUNCATE|GRANT|REVOKE)\b', re.IGNORECASE)
+
+def may_contain_ddl(sql_text):
+    """Plain substring check so DDL-free text never reaches the regex engine."""
+    upper_sql = sql_text.upper()
+    return any(keyword in upper_sql for keyword in _DDL_KEYWORDS)
+
+def validate_sql(sql_text, parsed=None, classified=False):
+    """
+    Validates SQL syntax and checks for DDL statements.
+    Pass the result of an earlier sqlparse.parse call as `parsed` to avoid parsing twice,
+    or classified=True when the caller has already matched the text as a single statement.
+    """
     try:
         if not sql_text.strip():
             return False, "Empty or invalid SQL."
         
         # Check for unsupported DDL statements
-        if re.search(r'\b(CREATE|ALTER|DROP|TRUNCATE|GRANT|REVOKE)\b', sql_text, re.IGNORECASE):
+        if may_contain_ddl(sql_text) and _DDL_RE.search(sql_text):
             return False, "DDL statements (CREATE, ALTER, DROP, etc.) are not allowed in this utility. Please use pure DML (SELECT, INSERT, UPDATE) queries."
         
-        parsed = sqlparse.parse(sql_text)
+        if classified:
+            return True, "SQL syntax looks valid."
+        if parsed is None:
+            parsed = sqlparse.parse(sql_text)
         if not parsed or len(parsed) == 0:
             return False, "Empty or invalid SQL."
 
@@ -25,53 +48,47 @@ def validate_sql(sql_text):
     except Exception as e:
         return False, f"SQL syntax error: {str(e)}"
 
+# Leading comments/whitespace, then SELECT or WITH
+_SELECT_HEAD_RE = re.compile(r'(?:\s|--[^\n]*\n|/\*.*?\*/)*(?:SELECT|WITH)\b', re.IGNORECASE | re.DOTALL)
+
 # --- Strip DDL Statements ---
+# Using a more comprehensive regex to catch more DDL types
+_DDL_STMT_RE = re.compile(r'(?i)(CREATE|ALTER|DROP|TRUNCATE|GRANT|REVOKE)\s+(OR\s+REPLACE\s+)?(VIEW|TABLE|PROCEDURE|FUNCTION|INDEX|SEQUENCE)\s+[^\n]+\n?')
+_AS_RE = re.compile(r'(?i)^AS\s*\n?')
+
 def strip_ddl(sql_text):
     """
     Strips CREATE, ALTER, and DROP statements from the SQL text.
     This is a fallback in case the validation is bypassed.
     """
-    # Using a more comprehensive regex to catch more DDL types
-    sql_text = re.sub(r'(?i)(CREATE|ALTER|DROP|TRUNCATE|GRANT|REVOKE)\s+(OR\s+REPLACE\s+)?(VIEW|TABLE|PROCEDURE|FUNCTION|INDEX|SEQUENCE)\s+[^\n]+\n?', '', sql_text)
-    sql_text = re.sub(r'(?i)^AS\s*\n?', '', sql_text)
+    if may_contain_ddl(sql_text):
+        sql_text = _DDL_STMT_RE.sub('', sql_text)
+    sql_text = _AS_RE.sub('', sql_text)
     return sql_text.strip()
 
 # --- Oracle to Snowflake SQL Conversion ---
+# Pure function of the text, so re-uploads of the same file skip the regex work
+@st.cache_data(max_entries=256, show_spinner=False)
 def convert_oracle_to_snowflake(sql_text):
-    """
-    Converts common Oracle functions to their Snowflake equivalents.
-    This function has been expanded for better coverage.
-    """
-    sql_text = re.sub(r'\bSYSDATE\b', 'CURRENT_TIMESTAMP', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bNVL\s*\(([^,]+),\s*([^)]+)\)', r'COALESCE(\1, \2)', sql_text, flags=re.IGNORECASE)
-    
-    # Improved DECODE conversion to handle multiple arguments
-    def decode_to_case(match):
-        args = [arg.strip() for arg in match.group(1).split(',')]
-        if len(args) < 3:
-            return match.group(0) # Not a valid DECODE, return original
-        
-        case_statement = f"CASE {args[0]} "
-        # Iterate over pairs of arguments (starting from the second)
-        for i in range(1, len(args) - 1, 2):
-            case_statement += f"WHEN {args[i]} THEN {args[i+1]} "
-        
-        # Add the ELSE clause if there's an odd number of arguments (meaning a default value)
-        if len(args) % 2 == 0:
-            case_statement += f"ELSE {args[-1]} "
-            
-        case_statement += "END"
-        return case_statement
-
-    sql_text = re.sub(r'\bDECODE\s*\(([^)]+)\)', decode_to_case, sql_text, flags=re.IGNORECASE)
-
-    sql_text = re.sub(r'\bTO_DATE\s*\(([^,]+),\s*([^)]+)\)', r"TO_DATE(\1, \2)", sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bTO_CHAR\s*\(([^,]+),\s*([^)]+)\)', r"TO_VARCHAR(\1, \2)", sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bTO_NUMBER\s*\(([^)]+)\)', r'TRY_TO_NUMBER(\1)', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bSUBSTR\s*\(([^,]+),\s*([^,]+)(?:,\s*([^)]+))?\)', r'SUBSTRING(\1, \2, \3)', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\(\+\)', '', sql_text)
-    sql_text = re.sub(r'\bROWNUM\s*<=\s*(\d+)', r'LIMIT \1', sql_text, flags=re.IGNORECASE)
-    return sql_text
+    """Converts common Oracle functions to their Snowflake equivalents (rules live in sql_conversion.py)."""
+    return convert_oracle_sql(sql_text)
+
+# --- Filename Sanitization ---
+# Characters outside the allowed set map to "_" via __missing__, non-ASCII included.
+class SafeNameTable(dict):
+    def __missing__(self, codepoint):
+        return "_"
+
+_SAFE_NAME_TABLE = SafeNameTable((ord(ch), ch) for ch in string.ascii_letters + string.digits + "_.")
+
+# --- Read Uploaded File ---
+def read_upload_text(file):
+    # Decode while reading rather than holding the raw bytes and the str at once.
+    stream = io.TextIOWrapper(file, encoding="utf-8", newline="")
+    try:
+        return stream.read()
+    finally:
+        stream.detach()  # leave the upload itself open
 
 # --- Wrap SQL in DBT Model ---
 def wrap_sql_in_dbt_model(sql_text, model_type):
@@ -79,48 +96,101 @@ def wrap_sql_in_dbt_model(sql_text, model_type):
     config = f"{{{{ config(materialized='{model_type}') }}}}"
     return f"{config}\n\n{sql_text}"
 
+# --- Check One Uploaded File ---
+def check_file(file):
+    """
+    Reads, classifies and validates a single upload. Runs on a worker thread, so it
+    only returns results; Streamlit output and the cached conversion stay on the main thread.
+    """
+    sql_content = read_upload_text(file)
+    
+    # A single statement that opens with SELECT/WITH needs no token walk;
+    # anything else falls back to sqlparse's per-statement type check.
+    parsed_statements = None
+    is_select = _SELECT_HEAD_RE.match(sql_content) is not None
+    if not is_select or ';' in sql_content.rstrip().rstrip(';'):
+        parsed_statements = sqlparse.parse(sql_content)
+        is_select = all(stmt.get_type() == 'SELECT' for stmt in parsed_statements)
+    
+    # parsed_statements is only None on the SELECT-head fast path, which needs no parse at all
+    is_valid, message = validate_sql(sql_content, parsed=parsed_statements, classified=parsed_statements is None)
+    return sql_content, is_select, is_valid, message
+
+# --- Convert and Save One Upload ---
+def save_model(file, sql_content, output_dir, model_type):
+    """Converts and saves a validated upload; calls the st.cache_data converter, so main thread only."""
+    # validate_sql has already rejected any DDL, so of strip_ddl only the leading-AS strip is left to do
+    converted_sql = convert_oracle_to_snowflake(_AS_RE.sub('', sql_content).strip())
+    wrapped_sql = wrap_sql_in_dbt_model(converted_sql, model_type)
+    
+    base_name = os.path.splitext(file.name)[0]
+    safe_name = base_name.translate(_SAFE_NAME_TABLE)
+    
+    # Create a clean filename without a random UUID for better readability
+    output_filename = os.path.join(output_dir, f"{safe_name}.sql")
+    
+    wrapped_bytes = wrapped_sql.encode("utf-8")
+    pathlib.Path(output_filename).write_bytes(wrapped_bytes)
+    return safe_name, output_filename, wrapped_sql, wrapped_bytes
+
 # --- Run DBT Command ---
 def run_dbt_command(command_list, project_dir):
     """
-    Runs a DBT command safely by using shlex to prevent shell injection.
+    Runs a DBT command without a shell; the arguments are passed straight through as argv.
     """
     try:
-        # Use shlex.split to safely handle the command list
-        command_list = ["dbt"] + shlex.split(" ".join(command_list))
-        result = subprocess.run(command_list, cwd=project_dir, capture_output=True, text=True, check=True)
+        result = subprocess.run(["dbt", *command_list], cwd=project_dir, capture_output=True, text=True, check=False)
         return result.stdout, result.stderr
-    except subprocess.CalledProcessError as e:
-        return e.stdout, e.stderr
     except Exception as e:
         return "", str(e)
 
+# --- Static Page Content ---
+# Each tab's static text goes out as one Markdown element instead of one per line.
+HOME_MD = """
+<h1 style='text-align: center; color: #2E86C1;'>🚀 Oracle to Snowflake DBT Migration</h1>
+
+### Introduction
+**A Python-powered Streamlit app that helps migrate Oracle SQL queries to Snowflake DBT models—complete with validation, conversion, and documentation.**
+
+#### Features
+- ✅ SQL Validation: Ensures your Oracle SQL syntax is correct before conversion.
+- 🔄 Oracle-to-Snowflake Conversion: Automatically translates Oracle-specific functions to Snowflake-compatible syntax.
+- 📦 Bulk Migration: Upload and process multiple SQL files in one go.
+- 🧱 DBT Model Wrapping: Wraps converted SQL into DBT-compatible models (view or table).
+- 📄 SQL File Generation: Saves converted SQL as downloadable DBT model files.
+- 🚀 Run DBT Commands: Execute DBT `run` or `test` directly from the app.
+"""
+
+ENV_MD = """
+## ⚙️ Environment Setup
+### 🛠️ Pre-Requisites
+Please ensure the following are installed on your system **before proceeding**:
+
+```
+python version: >=3.9 <=3.12
+```
+```bash
+pip install snowflake-connector-python
+pip install streamlit
+pip install dbt-core==1.9.4 dbt-snowflake==1.9.4
+```
+
+### For running the utility install below packages:
+```bash
+pip install sqlparse
+pip install pandas
+```
+"""
+
 # --- Streamlit UI ---
 st.set_page_config(page_title="Oracle to Snowflake DBT Migration", layout="wide")
 tab1, tab2, tab3 = st.tabs(["🏠 Home", "⚙️ Environment Setup", "📁 Migration Settings"])
 
 with tab1:
-    st.markdown("<h1 style='text-align: center; color: #2E86C1;'>🚀 Oracle to Snowflake DBT Migration</h1>", unsafe_allow_html=True)
-    st.markdown("### Introduction")
-    st.markdown("**A Python-powered Streamlit app that helps migrate Oracle SQL queries to Snowflake DBT models—complete with validation, conversion, and documentation.**")
-    st.markdown("#### Features")
-    st.markdown("- ✅ SQL Validation: Ensures your Oracle SQL syntax is correct before conversion.")
-    st.markdown("- 🔄 Oracle-to-Snowflake Conversion: Automatically translates Oracle-specific functions to Snowflake-compatible syntax.")
-    st.markdown("- 📦 Bulk Migration: Upload and process multiple SQL files in one go.")
-    st.markdown("- 🧱 DBT Model Wrapping: Wraps converted SQL into DBT-compatible models (view or table).")
-    st.markdown("- 📄 SQL File Generation: Saves converted SQL as downloadable DBT model files.")
-    st.markdown("- 🚀 Run DBT Commands: Execute DBT `run` or `test` directly from the app.")
+    st.markdown(HOME_MD, unsafe_allow_html=True)
 
 with tab2:
-    st.markdown("## ⚙️ Environment Setup")
-    st.markdown("### 🛠️ Pre-Requisites")
-    st.markdown("Please ensure the following are installed on your system **before proceeding**:")
-    st.code("python version: >=3.9 <=3.12")
-    st.code("pip install snowflake-connector-python")
-    st.code("pip install streamlit")
-    st.code("pip install dbt-core==1.9.4 dbt-snowflake==1.9.4")
-    st.subheader("For running the utility install below packages:")
-    st.code("pip install sqlparse")
-    st.code("pip install pandas")
+    st.markdown(ENV_MD)
 
     dbt_path = st.text_input("DBT Project Path", value=st.session_state.get("dbt_path", ""))
     subfolder = st.text_input("Subfolder inside models (optional)", value="oracle_migration")
@@ -152,7 +222,6 @@ with tab3:
     output_dir = None
     if dbt_path:
         output_dir = os.path.join(dbt_path, "models", subfolder)
-        os.makedirs(output_dir, exist_ok=True)
     else:
         st.warning("⚠️ Please provide a valid DBT project path to save models.")
 
@@ -162,49 +231,38 @@ with tab3:
     
     if st.button("🚀 Convert and Save Models"):
         if uploaded_files and output_dir:
+            # Created only when there is something to save, not on every rerun
+            os.makedirs(output_dir, exist_ok=True)
             with st.spinner("Converting SQL files..."):
-                for file in uploaded_files:
-                    try:
-                        sql_content = file.read().decode("utf-8")
-                        
-                        # Use a more explicit check for non-SELECT statements
-                        parsed_statements = sqlparse.parse(sql_content)
-                        is_select = True
-                        for stmt in parsed_statements:
-                            if not stmt.get_type() == 'SELECT':
-                                is_select = False
-                                st.warning(f"⚠️ `{file.name}` contains non-SELECT statements which may not be compatible with DBT models.")
-                                break
-                        
-                        is_valid, message = validate_sql(sql_content)
-                        if not is_valid:
-                            st.error(f"Validation failed for `{file.name}`: {message}")
-                            continue
-                            
-                        # Strip any DDL just in case the validation was bypassed
-                        cleaned_sql = strip_ddl(sql_content)
-                        
-                        converted_sql = convert_oracle_to_snowflake(cleaned_sql)
-                        wrapped_sql = wrap_sql_in_dbt_model(converted_sql, model_type)
-                        
-                        base_name = os.path.splitext(file.name)[0]
-                        safe_name = re.sub(r'[^a-zA-Z0-9_.]', '_', base_name)
-                        
-                        # Create a clean filename without a random UUID for better readability
-                        output_filename = os.path.join(output_dir, f"{safe_name}.sql")
-                        
-                        with open(output_filename, "w") as f:
-                            f.write(wrapped_sql)
-                            
-                        st.markdown(f"### ✅ Converted SQL for `{file.name}`")
-                        st.code(wrapped_sql, language="sql")
-                        
-                        with open(output_filename, "rb") as f:
-                            st.download_button(label=f"⬇️ Download `{safe_name}.sql`", data=f, file_name=f"{safe_name}.sql", mime="text/sql")
-                        
-                        st.success(f"✅ Saved to `{output_filename}`")
-                    except Exception as e:
-                        st.error(f"❌ Error processing `{file.name}`: {str(e)}")
+                with ThreadPoolExecutor(max_workers=min(8, len(uploaded_files))) as pool:
+                    futures = [pool.submit(check_file, file) for file in uploaded_files]
+                    # Collected by upload index; conversion runs here on the script thread
+                    results = []
+                    for file, future in zip(uploaded_files, futures):
+                        try:
+                            sql_content, is_select, is_valid, message = future.result()
+                            if is_valid:
+                                results.append((file, is_select, None, save_model(file, sql_content, output_dir, model_type)))
+                            else:
+                                results.append((file, is_select, f"Validation failed for `{file.name}`: {message}", None))
+                        except Exception as e:
+                            results.append((file, True, f"❌ Error processing `{file.name}`: {str(e)}", None))
+
+            for file, is_select, error, saved in results:
+                if not is_select:
+                    st.warning(f"⚠️ `{file.name}` contains non-SELECT statements which may not be compatible with DBT models.")
+                if error:
+                    st.error(error)
+                    continue
+
+                safe_name, output_filename, wrapped_sql, wrapped_bytes = saved
+
+                st.markdown(f"### ✅ Converted SQL for `{file.name}`")
+                st.code(wrapped_sql, language="sql")
+                
+                st.download_button(label=f"⬇️ Download `{safe_name}.sql`", data=wrapped_bytes, file_name=f"{safe_name}.sql", mime="text/sql")
+                
+                st.success(f"✅ Saved to `{output_filename}`")
         else:
             st.warning("⚠️ Please upload at least one SQL file and provide a valid DBT path.")
 
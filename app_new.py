@@ -3,7 +3,14 @@ import sqlparse
 import subprocess
 import os
 import yaml
-import glob
+from itertools import chain
+from sql_conversion import convert as convert_oracle_sql
+
+# LibYAML's C loader when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
 
 # --- SQL Validation ---
 def validate_sql(sql_text):
@@ -16,9 +23,11 @@ def validate_sql(sql_text):
         return False, str(e)
     
 # --- Function to parse dbt model YAML files ---
-def parse_dbt_yml(file_path):
+# mtime is part of the cache key so edited files are parsed again.
+@st.cache_data(show_spinner=False)
+def parse_dbt_yml(file_path, mtime):
     with open(file_path, 'r') as f:
-        data = yaml.safe_load(f)
+        data = yaml.load(f, Loader=YamlLoader)
     docs = []
     for model in data.get('models', []):
         model_name = model.get('name', 'Unnamed Model')
@@ -28,10 +37,24 @@ def parse_dbt_yml(file_path):
         docs.append(f"### {model_name}\n\n**Description**: {description}\n\n**Columns**:\n{column_docs}\n")
     return docs
 
+# --- Collect docs for every YAML file ---
+@st.cache_data(show_spinner=False)
+def build_docs(file_stamps):
+    all_docs = list(chain.from_iterable(parse_dbt_yml(path, mtime) for path, mtime in file_stamps))
+    return all_docs, "\n\n".join(all_docs)
+
+# --- Find dbt YAML files ---
+def find_yaml_files(root):
+    # One directory walk picks up both .yml and .yaml files.
+    for dir_path, _, file_names in os.walk(root):
+        for name in file_names:
+            if name.endswith(('.yml', '.yaml')):
+                yield os.path.join(dir_path, name)
+
 # --- Run DBT Command ---
-def run_dbt_command(command):
+def run_dbt_command(command_args, project_dir):
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+        result = subprocess.run(["dbt", *command_args, "--project-dir", project_dir], capture_output=True, text=True, check=False)
         return result.stdout, result.stderr
     except Exception as e:
         return "", str(e)
@@ -66,7 +89,7 @@ if current_page == "Home":
     st.markdown("### ✨ Features")
     st.markdown("""
     - ✅ SQL Validation  
-    - 🔄 Auto-conversion (placeholder)  
+    - 🔄 Oracle-to-Snowflake Conversion  
     - 📦 Bulk Migration  
     - 📘 Documentation Generator  
     - 🚀 Run DBT Commands (in Environment Setup)
@@ -92,8 +115,7 @@ elif current_page == "Migration Settings":
             for file in uploaded_files:
                 sql_content = file.read().decode("utf-8")
                 st.markdown(f"### Converted SQL for `{file.name}`")
-                # Placeholder: Add real Oracle to Snowflake SQL conversion logic here
-                converted_sql = f"-- Converted to {model_type}\n{sql_content}"  # Replace with actual conversion logic
+                converted_sql = f"-- Converted to {model_type}\n{convert_oracle_sql(sql_content)}"
                 st.code(converted_sql, language="sql")
             st.success("Conversion completed!")
         else:
@@ -111,7 +133,7 @@ elif current_page == "Migration Settings":
         if dbt_path:
             cmd = f"dbt {dbt_command} --project-dir {dbt_path}"
             st.markdown(f"### Running: `{cmd}`")
-            stdout, stderr = run_dbt_command(cmd)
+            stdout, stderr = run_dbt_command(dbt_command.split(), dbt_path)
             st.text_area("DBT Output", stdout, height=200)
             if stderr:
                 st.text_area("DBT Errors", stderr, height=200)
@@ -132,15 +154,11 @@ elif current_page == "Migration Settings":
     model_dir = st.text_input("Enter path to your dbt models directory", "./models")
     
     if model_dir and os.path.isdir(model_dir):
-        yml_files = glob.glob(os.path.join(model_dir, "**/*.yml"), recursive=True)
-        yaml_files = glob.glob(os.path.join(model_dir, "**/*.yaml"), recursive=True)
-        all_files = yml_files + yaml_files
+        all_files = list(find_yaml_files(model_dir))
         if all_files:
             st.success(f"Found {len(all_files)} YAML files.")
-            all_docs = []
-            for all_files in all_files:
-                docs = parse_dbt_yml(all_files)
-                all_docs.extend(docs)
+            file_stamps = tuple((path, os.path.getmtime(path)) for path in all_files)
+            all_docs, docs_markdown = build_docs(file_stamps)
 
             st.markdown("### Generated Documentation")
             for doc in all_docs:
@@ -148,7 +166,7 @@ elif current_page == "Migration Settings":
 
             if st.button("Export as Markdown"):
                 with open("dbt_docs.md", "w") as f:
-                    f.write("\n\n".join(all_docs))
+                    f.write(docs_markdown)
                 st.success("Documentation exported to `dbt_docs.md`.")
         else:
             st.warning("No YAML files found in the specified directory.")
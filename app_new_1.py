@@ -1,11 +1,20 @@
 import streamlit as st
 import sqlparse
 import subprocess
-import re
 import os
+import string
+import io
+import pathlib
 import uuid
 import yaml
-import glob
+from itertools import chain
+from sql_conversion import convert as convert_oracle_sql
+
+# LibYAML's C loader when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
 
 # --- SQL Validation ---
 def validate_sql(sql_text):
@@ -18,9 +27,11 @@ def validate_sql(sql_text):
         return False, str(e)
     
 # --- Function to parse dbt model YAML files ---
-def parse_dbt_yml(file_path):
+# mtime is part of the cache key so edited files are parsed again.
+@st.cache_data(show_spinner=False)
+def parse_dbt_yml(file_path, mtime):
     with open(file_path, 'r') as f:
-        data = yaml.safe_load(f)
+        data = yaml.load(f, Loader=YamlLoader)
     docs = []
     for model in data.get('models', []):
         model_name = model.get('name', 'Unnamed Model')
@@ -31,15 +42,26 @@ def parse_dbt_yml(file_path):
     return docs
 
 # --- Oracle to Snowflake SQL Conversion ---
+# Pure function of the text, so re-uploads of the same file skip the regex work
+@st.cache_data(max_entries=256, show_spinner=False)
 def convert_oracle_to_snowflake(sql_text):
-    sql_text = re.sub(r'\bSYSDATE\b', 'CURRENT_TIMESTAMP', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bNVL\s*\(([^,]+),\s*([^)]+)\)', r'COALESCE(\1, \2)', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bDECODE\s*\(\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^)]+)\)', r'CASE WHEN \1 = \2 THEN \3 ELSE \4 END', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bTO_DATE\s*\(\s*([^)]+)\)', r'\1::DATE', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\bTO_CHAR\s*\(\s*([^)]+)\)', r'\1::TEXT', sql_text, flags=re.IGNORECASE)
-    sql_text = re.sub(r'\(\+\)', '', sql_text)
-    sql_text = re.sub(r'\bROWNUM\s*<=\s*(\d+)', r'LIMIT \1', sql_text, flags=re.IGNORECASE)
-    return sql_text
+    return convert_oracle_sql(sql_text)
+
+# Characters outside the allowed set map to "_" via __missing__, non-ASCII included.
+class SafeNameTable(dict):
+    def __missing__(self, codepoint):
+        return "_"
+
+_SAFE_NAME_TABLE = SafeNameTable((ord(ch), ch) for ch in string.ascii_letters + string.digits + "_-")
+
+# --- Read Uploaded File ---
+def read_upload_text(file):
+    # Decode while reading rather than holding the raw bytes and the str at once.
+    stream = io.TextIOWrapper(file, encoding="utf-8", newline="")
+    try:
+        return stream.read()
+    finally:
+        stream.detach()  # leave the upload itself open
 
 # --- Wrap SQL in DBT Model ---
 def wrap_sql_in_dbt_model(sql_text, model_type, unique_key="id"):
@@ -57,10 +79,24 @@ def wrap_sql_in_dbt_model(sql_text, model_type, unique_key="id"):
     else:
         return sql_text
 
+# --- Collect docs for every YAML file ---
+@st.cache_data(show_spinner=False)
+def build_docs(file_stamps):
+    all_docs = list(chain.from_iterable(parse_dbt_yml(path, mtime) for path, mtime in file_stamps))
+    return all_docs, "\n\n".join(all_docs)
+
+# --- Find dbt YAML files ---
+def find_yaml_files(root):
+    # One directory walk picks up both .yml and .yaml files.
+    for dir_path, _, file_names in os.walk(root):
+        for name in file_names:
+            if name.endswith(('.yml', '.yaml')):
+                yield os.path.join(dir_path, name)
+
 # --- Run DBT Command ---
-def run_dbt_command(command):
+def run_dbt_command(command_args, project_dir):
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+        result = subprocess.run(["dbt", *command_args, "--project-dir", project_dir], capture_output=True, text=True, check=False)
         return result.stdout, result.stderr
     except Exception as e:
         return "", str(e)
@@ -119,13 +155,13 @@ elif current_page == "Migration Settings":
         unique_key = st.text_input("Enter unique_key for incremental model", value="id")
 
     output_dir = "converted_models"
-    os.makedirs(output_dir, exist_ok=True)
 
     if st.button("Convert and Save Models"):
         if uploaded_files:
+            os.makedirs(output_dir, exist_ok=True)
             for file in uploaded_files:
                 try:
-                    sql_content = file.read().decode("utf-8")
+                    sql_content = read_upload_text(file)
                     is_valid, message = validate_sql(sql_content)
                     if not is_valid:
                         st.error(f"Validation failed for `{file.name}`: {message}")
@@ -136,17 +172,16 @@ elif current_page == "Migration Settings":
 
                     # Sanitize filename
                     base_name = os.path.splitext(file.name)[0]
-                    safe_name = re.sub(r'[^a-zA-Z0-9_\-]', '_', base_name)
+                    safe_name = base_name.translate(_SAFE_NAME_TABLE)
                     output_filename = os.path.join(output_dir, f"{safe_name}_{uuid.uuid4().hex[:8]}.sql")
 
                     # Save to .sql file
                     try:
-                        with open(output_filename, "w") as f:
-                            f.write(wrapped_sql)
+                        wrapped_bytes = wrapped_sql.encode("utf-8")
+                        pathlib.Path(output_filename).write_bytes(wrapped_bytes)
                         st.markdown(f"### Converted SQL for `{file.name}`")
                         st.code(wrapped_sql, language="sql")
-                        with open(output_filename, "rb") as f:
-                            st.download_button(label=f"Download `{safe_name}.sql`", data=f, file_name=f"{safe_name}.sql")
+                        st.download_button(label=f"Download `{safe_name}.sql`", data=wrapped_bytes, file_name=f"{safe_name}.sql")
                         st.success(f"Saved to `{output_filename}`")
                     except Exception as e:
                         st.error(f"Failed to save `{file.name}`: {str(e)}")
@@ -164,7 +199,7 @@ elif current_page == "Migration Settings":
         if dbt_path:
             cmd = f"dbt {dbt_command} --project-dir {dbt_path}"
             st.markdown(f"### Running: `{cmd}`")
-            stdout, stderr = run_dbt_command(cmd)
+            stdout, stderr = run_dbt_command(dbt_command.split(), dbt_path)
             st.text_area("DBT Output", stdout, height=200)
             if stderr:
                 st.text_area("DBT Errors", stderr, height=200)
@@ -185,15 +220,11 @@ elif current_page == "Migration Settings":
     model_dir = st.text_input("Enter path to your dbt models directory", "./models")
     
     if model_dir and os.path.isdir(model_dir):
-        yml_files = glob.glob(os.path.join(model_dir, "**/*.yml"), recursive=True)
-        yaml_files = glob.glob(os.path.join(model_dir, "**/*.yaml"), recursive=True)
-        all_files = yml_files + yaml_files
+        all_files = list(find_yaml_files(model_dir))
         if all_files:
             st.success(f"Found {len(all_files)} YAML files.")
-            all_docs = []
-            for all_files in all_files:
-                docs = parse_dbt_yml(all_files)
-                all_docs.extend(docs)
+            file_stamps = tuple((path, os.path.getmtime(path)) for path in all_files)
+            all_docs, docs_markdown = build_docs(file_stamps)
 
             st.markdown("### Generated Documentation")
             for doc in all_docs:
@@ -201,7 +232,7 @@ elif current_page == "Migration Settings":
 
             if st.button("Export as Markdown"):
                 with open("dbt_docs.md", "w") as f:
-                    f.write("\n\n".join(all_docs))
+                    f.write(docs_markdown)
                 st.success("Documentation exported to `dbt_docs.md`.")
         else:
             st.warning("No YAML files found in the specified directory.")
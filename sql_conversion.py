@@ -0,0 +1,136 @@
+# sql_conversion.py
+# Oracle -> Snowflake rewrites shared by the migration apps. Each app passes the call
+# rewrite table matching its target style (ORACLE_CALL_REWRITES or CAST_CALL_REWRITES).
+
+# Drop-in faster matcher when the third-party regex package is installed
+try:
+    import regex as re
+except ImportError:
+    import re
+
+# --- Oracle to Snowflake SQL Conversion ---
+# Function calls are located with a balanced-parenthesis scan rather than [^)]+ captures,
+# so arguments that contain nested calls (e.g. TO_NUMBER(NVL(a, 0))) are split correctly
+# and converted recursively. The remaining tokens are rewritten in one regex pass;
+# rewrite_oracle_token dispatches on the name of the group that matched.
+ORACLE_CALL_PATTERN = re.compile(r'\b(NVL|DECODE|TO_DATE|TO_CHAR|TO_NUMBER|SUBSTR)\s*\(', re.IGNORECASE)
+ORACLE_TOKEN_PATTERN = re.compile(
+    r'(?P<sysdate>\bSYSDATE\b)'
+    r'|(?P<outer_join>\(\+\))'
+    r'|(?P<rownum>\bROWNUM\s*<=\s*(?P<rownum_limit>\d+))',
+    re.IGNORECASE,
+)
+
+def find_balanced(sql_text, start):
+    """Returns the index of the ')' closing the '(' at start, or None if it is never closed."""
+    depth, i = 0, start
+    while i < len(sql_text):
+        char = sql_text[i]
+        if char in ("'", '"'):
+            i = sql_text.find(char, i + 1)
+            if i < 0:
+                return None
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return None
+
+def split_args(arg_text):
+    """Splits call arguments on commas outside nested parentheses, string literals and quoted identifiers."""
+    args, depth, start, quote = [], 0, 0, None
+    for i, char in enumerate(arg_text):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            args.append(arg_text[start:i].strip())
+            start = i + 1
+    args.append(arg_text[start:].strip())
+    return args
+
+# Improved DECODE conversion to handle multiple arguments
+def decode_to_case(args):
+    if len(args) < 3:
+        return None # Not a valid DECODE, leave it as is
+
+    parts = [f"CASE {args[0]} "]
+    # Iterate over pairs of arguments (starting from the second)
+    parts.extend(f"WHEN {args[i]} THEN {args[i+1]} " for i in range(1, len(args) - 1, 2))
+
+    # Add the ELSE clause if there's an even number of arguments (the last one is the default value)
+    if len(args) % 2 == 0:
+        parts.append(f"ELSE {args[-1]} ")
+
+    parts.append("END")
+    return "".join(parts)
+
+def substring(args):
+    return f"SUBSTRING({', '.join(args)})" if len(args) in (2, 3) else None
+
+# Each rewrite receives already-converted arguments; None leaves a call with an unexpected arity as is.
+ORACLE_CALL_REWRITES = {
+    "NVL": lambda args: f"COALESCE({args[0]}, {args[1]})" if len(args) == 2 else None,
+    "DECODE": decode_to_case,
+    "TO_DATE": lambda args: f"TO_DATE({args[0]}, {args[1]})" if len(args) == 2 else None,
+    "TO_CHAR": lambda args: f"TO_VARCHAR({args[0]}, {args[1]})" if len(args) == 2 else None,
+    "TO_NUMBER": lambda args: f"TRY_TO_NUMBER({', '.join(args)})",
+    "SUBSTR": substring,
+}
+
+# Cast-style rules used by app1.py and app7.py: single-argument TO_DATE/TO_CHAR become
+# :: casts and DECODE only handles the one-pair form.
+CAST_CALL_REWRITES = {
+    "NVL": lambda args: f"COALESCE({args[0]}, {args[1]})" if len(args) == 2 else None,
+    "DECODE": lambda args: (
+        f"CASE WHEN {args[0]} = {args[1]} THEN {args[2]} ELSE {args[3]} END" if len(args) == 4 else None
+    ),
+    "TO_DATE": lambda args: f"{args[0]}::DATE" if len(args) == 1 else None,
+    "TO_CHAR": lambda args: f"{args[0]}::TEXT" if len(args) == 1 else None,
+    "TO_NUMBER": lambda args: f"CAST({args[0]} AS NUMBER)" if len(args) == 1 else None,
+    "SUBSTR": substring,
+}
+
+ORACLE_TOKEN_REWRITES = {
+    "sysdate": lambda m: "CURRENT_TIMESTAMP",
+    "outer_join": lambda m: "",
+    "rownum": lambda m: f"LIMIT {m['rownum_limit']}",
+}
+
+def rewrite_oracle_token(match):
+    return ORACLE_TOKEN_REWRITES[match.lastgroup](match)
+
+def convert(sql_text, call_rewrites=ORACLE_CALL_REWRITES):
+    """
+    Converts common Oracle functions to their Snowflake equivalents,
+    rewriting calls outermost-first and each call's arguments recursively.
+    Functions missing from call_rewrites are left as they are.
+    """
+    parts, pos = [], 0
+    for match in ORACLE_CALL_PATTERN.finditer(sql_text):
+        if match.start() < pos:
+            continue  # nested inside a call that was already rewritten
+        close = find_balanced(sql_text, match.end() - 1)
+        if close is None:
+            continue
+        rewrite = call_rewrites.get(match.group(1).upper())
+        if rewrite is None:
+            continue
+        args = [convert(arg, call_rewrites) for arg in split_args(sql_text[match.end():close])]
+        rewritten = rewrite(args)
+        if rewritten is None:
+            continue  # calls nested inside it are still picked up
+        parts.append(ORACLE_TOKEN_PATTERN.sub(rewrite_oracle_token, sql_text[pos:match.start()]))
+        parts.append(rewritten)
+        pos = close + 1
+    parts.append(ORACLE_TOKEN_PATTERN.sub(rewrite_oracle_token, sql_text[pos:]))
+    return "".join(parts)
@@ -0,0 +1,68 @@
+# test_oracle_conversion.py
+# Regression checks for the Oracle -> Snowflake rewrites, in particular calls nested
+# inside other calls' arguments. Run with: python -m unittest test_oracle_conversion
+import unittest
+
+from sql_conversion import CAST_CALL_REWRITES, convert
+
+
+class ConversionTest(unittest.TestCase):
+    """Default rules, used by app7_ final.py, app7_v23_test.py, app7new.py, app_new.py and app_new_1.py."""
+
+    def test_nested_calls(self):
+        self.assertEqual(convert("SELECT TO_NUMBER(NVL(a,0)) FROM t"), "SELECT TRY_TO_NUMBER(COALESCE(a, 0)) FROM t")
+        self.assertEqual(convert("SELECT TO_CHAR(NVL(a,b), 'YYYY') FROM t"), "SELECT TO_VARCHAR(COALESCE(a, b), 'YYYY') FROM t")
+        self.assertEqual(convert("SELECT NVL(TO_CHAR(d,'YYYY'),'x') FROM t"), "SELECT COALESCE(TO_VARCHAR(d, 'YYYY'), 'x') FROM t")
+        self.assertEqual(convert("SELECT SUBSTR(NVL(a,b),1,3) FROM t"), "SELECT SUBSTRING(COALESCE(a, b), 1, 3) FROM t")
+        self.assertEqual(convert("SELECT SUBSTR(NVL(a,b),1) FROM t"), "SELECT SUBSTRING(COALESCE(a, b), 1) FROM t")
+
+    def test_decode_default(self):
+        self.assertEqual(
+            convert("SELECT DECODE(NVL(a,0),1,'x','y') FROM t"),
+            "SELECT CASE COALESCE(a, 0) WHEN 1 THEN 'x' ELSE 'y' END FROM t",
+        )
+        self.assertEqual(
+            convert("SELECT DECODE(x, NVL(y,0), 'a', 'b') FROM t"),
+            "SELECT CASE x WHEN COALESCE(y, 0) THEN 'a' ELSE 'b' END FROM t",
+        )
+        self.assertEqual(convert("SELECT DECODE(a, 1, 'x') FROM t"), "SELECT CASE a WHEN 1 THEN 'x' END FROM t")
+
+    def test_unsupported_arity_keeps_call_but_converts_inside(self):
+        self.assertEqual(convert("SELECT TO_DATE(NVL(a,b)) FROM t"), "SELECT TO_DATE(COALESCE(a, b)) FROM t")
+
+    def test_quoted_commas_do_not_split_arguments(self):
+        self.assertEqual(convert("""SELECT NVL("a,b", 'x,y') FROM t"""), """SELECT COALESCE("a,b", 'x,y') FROM t""")
+
+    def test_tokens(self):
+        self.assertEqual(
+            convert("SELECT SYSDATE FROM a, b WHERE a.id = b.id(+) AND ROWNUM <= 10"),
+            "SELECT CURRENT_TIMESTAMP FROM a, b WHERE a.id = b.id AND LIMIT 10",
+        )
+
+    def test_clean_sql_is_unchanged(self):
+        self.assertEqual(convert("SELECT a FROM t"), "SELECT a FROM t")
+
+
+class CastConversionTest(unittest.TestCase):
+    """Cast-style rules, used by app1.py and app7.py."""
+
+    def convert(self, sql_text):
+        return convert(sql_text, CAST_CALL_REWRITES)
+
+    def test_nested_calls(self):
+        self.assertEqual(self.convert("SELECT TO_CHAR(NVL(a,b)) FROM t"), "SELECT COALESCE(a, b)::TEXT FROM t")
+        self.assertEqual(self.convert("SELECT NVL(TO_DATE(d), SYSDATE) FROM t"), "SELECT COALESCE(d::DATE, CURRENT_TIMESTAMP) FROM t")
+        self.assertEqual(self.convert("SELECT TO_NUMBER(NVL(a,0)) FROM t"), "SELECT CAST(COALESCE(a, 0) AS NUMBER) FROM t")
+        self.assertEqual(self.convert("SELECT SUBSTR(NVL(a,b),1,3) FROM t"), "SELECT SUBSTRING(COALESCE(a, b), 1, 3) FROM t")
+        self.assertEqual(
+            self.convert("SELECT DECODE(NVL(a,0), 1, 'x,y', TO_CHAR(b)) FROM t"),
+            "SELECT CASE WHEN COALESCE(a, 0) = 1 THEN 'x,y' ELSE b::TEXT END FROM t",
+        )
+
+    def test_missing_rule_leaves_call(self):
+        rules = {name: CAST_CALL_REWRITES[name] for name in ("NVL", "TO_CHAR")}
+        self.assertEqual(convert("SELECT TO_NUMBER(NVL(a,0)) FROM t", rules), "SELECT TO_NUMBER(COALESCE(a, 0)) FROM t")
+
+
+if __name__ == "__main__":
+    unittest.main()